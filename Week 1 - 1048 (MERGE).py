@@ -6,26 +6,25 @@ def merge(line):
     """
     Function that merges a single row or column in 2048.
     """
-    # 1. Create a new list of equal dimensions for the resulting list.
-    newlist = [0] * len(line)
-    last_merged = False
-
-    # 2. Look for non-zero values, and will copy over to the next available entry of the resulting list.
-       
     if len(line) < 2:
         return line
 
-    for entry_index in range(0, len(line)):
-        if line[entry_index] != 0:
-            for re_index in range(0, len(newlist)):
-                if newlist[re_index] == 0:
-                    newlist[re_index] = line[entry_index]
-                    last_merged = False
-                    break
-                elif newlist[re_index + 1] == 0:
-                    if newlist[re_index] == line[entry_index] and last_merged is False:
-                        newlist[re_index] = newlist[re_index] + line[entry_index]
-                        last_merged = True
-                        break
+    # 1. Create a new list of equal dimensions for the resulting list.
+    newlist = [0] * len(line)
+    target = 0
+    can_merge = False
+
+    # 2. Walk the line once, sliding each non-zero value into the next
+    #    free entry, or merging it into the previous entry if that entry
+    #    holds the same value and has not merged yet.
+    for value in line:
+        if value != 0:
+            if can_merge and newlist[target - 1] == value:
+                newlist[target - 1] += value
+                can_merge = False
+            else:
+                newlist[target] = value
+                target += 1
+                can_merge = True
 
     return newlist
@@ -2,8 +2,14 @@
 Clone of 2048 game.
 """
 
-import poc_2048_gui
 import random
+import time
+import collections
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Directions, DO NOT MODIFY
 UP = 1
@@ -26,55 +32,234 @@ def merge(line):
     """
     Function that merges a single row or column in 2048.
     """
-    # 1. Create a new list of equal dimensions for the resulting list.
-    newlist = [0] * len(line)
-    last_merged = False
-
-    # 2. Look for non-zero values, and will copy over to the next available entry of the resulting list.
-       
     if len(line) < 2:
         return line
 
-    for entry_index in range(0, len(line)):
-        if line[entry_index] != 0:
-            for re_index in range(0, len(newlist)):
-                if newlist[re_index] == 0:
-                    newlist[re_index] = line[entry_index]
-                    last_merged = False
-                    break
-                elif newlist[re_index + 1] == 0:
-                    if newlist[re_index] == line[entry_index] and last_merged is False:
-                        newlist[re_index] = newlist[re_index] + line[entry_index]
-                        last_merged = True
-                        break
+    # 1. Create a new list of equal dimensions for the resulting list.
+    newlist = [0] * len(line)
+    target = 0
+    can_merge = False
+
+    # 2. Walk the line once, sliding each non-zero value into the next
+    #    free entry, or merging it into the previous entry if that entry
+    #    holds the same value and has not merged yet.
+    for value in line:
+        if value != 0:
+            if can_merge and newlist[target - 1] == value:
+                newlist[target - 1] += value
+                can_merge = False
+            else:
+                newlist[target] = value
+                target += 1
+                can_merge = True
 
     return newlist
 
 
+def merge_score(line):
+    """
+    Return the points scored by merging a single row or column,
+    the sum of the tiles created by merges.
+    """
+    points = 0
+    previous = 0
+    for value in line:
+        if value != 0:
+            if value == previous:
+                points += 2 * value
+                previous = 0
+            else:
+                previous = value
+    return points
+
+
+"""
+Lookup table merge for 4-wide lines.
+
+A line is packed into a 16 bit integer holding 4 bits per tile, each
+the log2 exponent of the tile (0 for an empty square), with the first
+tile of the line in the lowest 4 bits.  The table maps every packed
+line to its packed merged line.  It is built on first use and shared
+by every board.
+"""
+
+TABLE_LINE_LENGTH = 4
+MAX_TABLE_EXPONENT = 15
+NO_TABLE_ENTRY = -1
+
+# Tile value <-> exponent conversions for the packed encoding.
+TILE_VALUES = [0] + [2 ** exponent for exponent in range(1, MAX_TABLE_EXPONENT + 1)]
+TILE_EXPONENTS = dict((value, exponent) for exponent, value in enumerate(TILE_VALUES))
+
+_ROW_TABLE = []
+_ROW_RESULTS = []
+
+
+def pack_line(line):
+    """
+    Pack a line of tile values into an integer of 4 bit exponents.
+    Returns None if some tile cannot be represented.
+    """
+    packed = 0
+    shift = 0
+    for value in line:
+        exponent = TILE_EXPONENTS.get(value)
+        if exponent is None:
+            return None
+        packed |= exponent << shift
+        shift += 4
+    return packed
+
+
+def unpack_line(packed, length):
+    """
+    Unpack an integer of 4 bit exponents into a list of tile values.
+    """
+    return [TILE_VALUES[(packed >> (4 * index)) & 0xF] for index in range(length)]
+
+
+def _build_row_table():
+    """
+    Merge every possible packed 4-wide line.  Lines whose merge would
+    produce a tile above the largest packable value are marked with
+    NO_TABLE_ENTRY.
+    """
+    table = [NO_TABLE_ENTRY] * (1 << (4 * TABLE_LINE_LENGTH))
+    results = [None] * len(table)
+    for packed in range(len(table)):
+        merged = merge(unpack_line(packed, TABLE_LINE_LENGTH))
+        merged_packed = pack_line(merged)
+        if merged_packed is not None:
+            table[packed] = merged_packed
+            results[packed] = tuple(merged)
+    return table, results
+
+
+def get_row_table():
+    """
+    Return the shared line lookup table, building it on first use.
+    """
+    if not _ROW_TABLE:
+        table, results = _build_row_table()
+        _ROW_TABLE.extend(table)
+        _ROW_RESULTS.extend(results)
+    return _ROW_TABLE
+
+
+def merge_lookup(line):
+    """
+    Merge a single row or column with one table lookup, falling
+    back to merge() for lines the table does not cover.
+    """
+    if len(line) == TABLE_LINE_LENGTH:
+        if not _ROW_RESULTS:
+            get_row_table()
+        try:
+            merged = _ROW_RESULTS[TILE_EXPONENTS[line[0]] |
+                                  TILE_EXPONENTS[line[1]] << 4 |
+                                  TILE_EXPONENTS[line[2]] << 8 |
+                                  TILE_EXPONENTS[line[3]] << 12]
+        except KeyError:
+            merged = None
+        if merged is not None:
+            return list(merged)
+    return merge(line)
+
+
 class TwentyFortyEight:
     """
     Class to run the game logic.
     """
 
-    def __init__(self, grid_height, grid_width):
+    def __init__(self, grid_height, grid_width, use_table=False):
         self._height = grid_height
         self._width = grid_width
+        # Merging 4-wide lines through the shared lookup table is optional.
+        self._merge = merge_lookup if use_table else merge
         self._grid = []
+        # Empty squares, kept in a list for uniform picks plus a map
+        # from square to list position for O(1) removal.
+        self._empty = []
+        self._empty_index = {}
+        self._score = 0
+        # Directions that change the board, computed on demand and
+        # dropped on every write.
+        self._legal_moves = None
+        # Open undo frames, each a (score, [(row, col, old value)]) pair
+        # recording the writes made since push_undo().
+        self._undo_frames = []
         self.reset()
         self._borders = {UP: [(0,col)for col in range(self._width)] ,
                    DOWN: [(self._height-1,col)for col in range(self._width)],
                    LEFT: [(row,0)for row in range(self._height)],
                    RIGHT: [(row,self._width-1)for row in range(self._height)]}
 
+        # Squares of every row or column, walked from the border in
+        # the OFFSETS direction, so moves need no index arithmetic.
+        self._lines = {}
+        for direction in self._borders:
+            steps = self._height
+            if direction == RIGHT or direction == LEFT:
+                steps = self._width
+            self._lines[direction] = [
+                [(start[0] + step * OFFSETS[direction][0],
+                  start[1] + step * OFFSETS[direction][1]) for step in range(steps)]
+                for start in self._borders[direction]]
+
     def reset(self):
         """
         Reset the game so the grid is empty except for two
         initial tiles.
         """
-        self._grid = [[0 for i in range(self._width)] for j in range(self._height)]
+        self._load([[0 for i in range(self._width)] for j in range(self._height)], 0)
         self.new_tile()
         self.new_tile()
 
+    def _load(self, grid, score):
+        """
+        Replace the whole grid and score, rebuilding the empty square
+        index and dropping any open undo frames.
+        """
+        self._grid = [list(row) for row in grid]
+        self._empty = [(row, col) for row in range(self._height)
+                       for col in range(self._width) if self._grid[row][col] == 0]
+        self._empty_index = dict((square, index)
+                                 for index, square in enumerate(self._empty))
+        self._score = score
+        self._legal_moves = None
+        self._undo_frames = []
+
+    def snapshot(self):
+        """
+        Return an immutable, hashable (grid, score) snapshot of the
+        game, where grid is a tuple of row tuples.
+        """
+        return tuple(tuple(row) for row in self._grid), self._score
+
+    def restore(self, snapshot):
+        """
+        Return the game to a state taken by snapshot().
+        """
+        grid, score = snapshot
+        self._load(grid, score)
+
+    def push_undo(self):
+        """
+        Start recording writes so undo() can roll them back.
+        Frames nest; each undo() rolls back the latest one.
+        """
+        self._undo_frames.append((self._score, []))
+
+    def undo(self):
+        """
+        Roll back every write made since the matching push_undo(),
+        in time proportional to the number of squares changed.
+        """
+        score, changes = self._undo_frames.pop()
+        for row, col, value in reversed(changes):
+            self._put(row, col, value, False)
+        self._score = score
+
     def __str__(self):
         """
         Return a string representation of the grid for debugging.
@@ -98,39 +283,31 @@ class TwentyFortyEight:
 
     
     
+    def get_score(self):
+        """
+        Get the points scored by merges since the last reset.
+        """
+        return self._score
+
     def move(self, direction):
         """
         Move all tiles in the given direction and add
         a new tile if any tiles moved.
         """
-        steps = self._height
         changed = False
-        
-        old = []
-        new = []
-        if direction == RIGHT or direction == LEFT:
-            steps = self._width
-        
-               
-        for index in self._borders[direction]:
-            
-            old=[]
-            for step in range(steps):
-                row = index[0] + step * OFFSETS[direction][0] 
-                col = index[1] + step * OFFSETS[direction][1]
-                old.append(self._grid[row][col])
 
-            new = merge(old)
-            
+        for squares in self._lines[direction]:
+            old = [self._grid[row][col] for row, col in squares]
+            new = self._merge(old)
+
             if old != new :
                 changed = True
- 
-            
-            for step in range(steps):
-                row = index[0] + step * OFFSETS[direction][0]
-                col = index[1] + step * OFFSETS[direction][1]
-                self._grid[row][col]=new[step]
-      
+                self._score += merge_score(old)
+
+                for step in range(len(squares)):
+                    if new[step] != old[step]:
+                        row, col = squares[step]
+                        self._put(row, col, new[step])
 
         if changed:
             self.new_tile()
@@ -144,33 +321,881 @@ class TwentyFortyEight:
         square.  The tile should be 2 90% of the time and
         4 10% of the time.
         """
-        flag = True
+        if not self._empty:
+            raise ValueError("no empty square for a new tile")
 
-        while flag :
-            col = random.randrange(self._width)
-            row = random.randrange(self._height)
-            if self._grid[row][col] == 0 :
-                flag = False
-                if random.random() <= .1 :
-                    self._grid[row][col] = 4
-                else :
-                    self._grid[row][col] = 2 
+        row, col = random.choice(self._empty)
+        if random.random() <= .1 :
+            self._put(row, col, 4)
+        else :
+            self._put(row, col, 2)
 
 
+    def get_empty_count(self):
+        """
+        Return the number of empty squares on the board.
+        """
+        return len(self._empty)
+
+    def _put(self, row, col, value, record=True):
+        """
+        Write a tile and keep the empty square index up to date,
+        recording the old value in the open undo frame if any.
+        """
+        if record and self._undo_frames:
+            self._undo_frames[-1][1].append((row, col, self._grid[row][col]))
+        was_empty = self._grid[row][col] == 0
+        self._grid[row][col] = value
+        self._legal_moves = None
+        if was_empty and value != 0:
+            # Swap the last empty square into the removed slot.
+            index = self._empty_index.pop((row, col))
+            last = self._empty.pop()
+            if index < len(self._empty):
+                self._empty[index] = last
+                self._empty_index[last] = index
+        elif not was_empty and value == 0:
+            self._empty_index[(row, col)] = len(self._empty)
+            self._empty.append((row, col))
+
     def set_tile(self, row, col, value):
         """
         Set the tile at position row, col to have the given value.
         """
-        self._grid[row][col] = value
-        
+        self._put(row, col, value)
+
+    def legal_moves(self):
+        """
+        Return a tuple of the directions that would change the board,
+        without moving any tiles.
+        """
+        if self._legal_moves is None:
+            self._legal_moves = tuple(direction for direction in (UP, DOWN, LEFT, RIGHT)
+                                      if self._can_move(direction))
+        return self._legal_moves
+
+    def is_game_over(self):
+        """
+        Return True if no direction changes the board.
+        """
+        return not self.legal_moves()
+
+    def _can_move(self, direction):
+        """
+        A line changes if a tile has an empty square ahead of it or
+        sits next to an equal tile.
+        """
+        for squares in self._lines[direction]:
+            previous = 0
+            seen_empty = False
+            for row, col in squares:
+                value = self._grid[row][col]
+                if value == 0:
+                    seen_empty = True
+                elif seen_empty or value == previous:
+                    return True
+                previous = value
+        return False
+
+    def peek_move(self, direction):
+        """
+        Return the grid that moving in the given direction would
+        produce, before any new tile, and the points it would score.
+        The board itself is left unchanged.
+        """
+        grid = [list(row) for row in self._grid]
+        points = 0
+        for squares in self._lines[direction]:
+            old = [grid[row][col] for row, col in squares]
+            new = self._merge(old)
+            if old != new:
+                points += merge_score(old)
+                for step in range(len(squares)):
+                    row, col = squares[step]
+                    grid[row][col] = new[step]
+        return grid, points
+
 
     def get_tile(self, row, col):
         """
         Return the value of the tile at position row, col.
         """
-        return self._grid[row][col] 
+        return self._grid[row][col]
+
+
+"""
+Bitboard backend for 4x4 games.
+
+The whole board is packed into one 64 bit integer of 4 bit exponents:
+square (row, col) lives in bits 4 * (4 * row + col) and up, so each
+row is a packed line as used by the lookup table above.  Rows move
+through the left and right line tables, and columns by transposing
+the board, moving its rows and transposing back.
+"""
+
+BOARD_SIZE = 4
+ROW_MASK = 0xFFFF
+
+_LEFT_TABLE = []
+_RIGHT_TABLE = []
+
+
+def _reverse_line(packed):
+    """
+    Reverse the order of the four tiles in a packed line.
+    """
+    return (((packed & 0xF) << 12) | ((packed & 0xF0) << 4) |
+            ((packed >> 4) & 0xF0) | ((packed >> 12) & 0xF))
+
+
+def _merge_capped(packed):
+    """
+    Merge a packed line whose result does not fit the table encoding.
+    Tiles of the largest packable value are left unmerged.
+    """
+    tiles = [(packed >> (4 * index)) & 0xF for index in range(BOARD_SIZE)]
+    tiles = [exponent for exponent in tiles if exponent != 0]
+    merged = 0
+    shift = 0
+    index = 0
+    while index < len(tiles):
+        exponent = tiles[index]
+        if (index + 1 < len(tiles) and tiles[index + 1] == exponent and
+                exponent < MAX_TABLE_EXPONENT):
+            exponent += 1
+            index += 1
+        merged |= exponent << shift
+        shift += 4
+        index += 1
+    return merged
+
+
+def get_bitboard_tables():
+    """
+    Return the shared (left, right) line tables used by bitboards,
+    building them from the row table on first use.
+    """
+    if not _LEFT_TABLE:
+        row_table = get_row_table()
+        left = [entry if entry != NO_TABLE_ENTRY else _merge_capped(packed)
+                for packed, entry in enumerate(row_table)]
+        right = [_reverse_line(left[_reverse_line(packed)])
+                 for packed in range(len(left))]
+        _LEFT_TABLE.extend(left)
+        _RIGHT_TABLE.extend(right)
+    return _LEFT_TABLE, _RIGHT_TABLE
+
+
+def transpose(board):
+    """
+    Transpose a packed 4x4 board, swapping rows and columns.
+    """
+    part1 = board & 0xF0F00F0FF0F00F0F
+    part2 = board & 0x0000F0F00000F0F0
+    part3 = board & 0x0F0F00000F0F0000
+    board = part1 | (part2 << 12) | (part3 >> 12)
+    part1 = board & 0xFF00FF0000FF00FF
+    part2 = board & 0x00FF00FF00000000
+    part3 = board & 0x00000000FF00FF00
+    return part1 | (part2 >> 24) | (part3 << 24)
+
+
+def move_rows(board, table):
+    """
+    Move every row of a packed board through a line table.
+    """
+    return (table[board & ROW_MASK] |
+            (table[(board >> 16) & ROW_MASK] << 16) |
+            (table[(board >> 32) & ROW_MASK] << 32) |
+            (table[(board >> 48) & ROW_MASK] << 48))
+
+
+def move_board(board, direction):
+    """
+    Return the packed board after moving all tiles in the given
+    direction, without adding a new tile.
+    """
+    left, right = get_bitboard_tables()
+    if direction == LEFT:
+        return move_rows(board, left)
+    if direction == RIGHT:
+        return move_rows(board, right)
+    if direction == UP:
+        return transpose(move_rows(transpose(board), left))
+    return transpose(move_rows(transpose(board), right))
+
+
+class TwentyFortyEightBitboard:
+    """
+    4x4 game logic on a packed 64 bit board.  Tiles above 32768
+    cannot be represented, so two 32768 tiles never merge.
+    """
+
+    def __init__(self, grid_height=BOARD_SIZE, grid_width=BOARD_SIZE):
+        if grid_height != BOARD_SIZE or grid_width != BOARD_SIZE:
+            raise ValueError("bitboards only support 4x4 games")
+        self._board = 0
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the game so the grid is empty except for two
+        initial tiles.
+        """
+        self._board = 0
+        self.new_tile()
+        self.new_tile()
+
+    def __str__(self):
+        """
+        Return a string representation of the grid for debugging.
+        """
+        return "\n".join(" ".join(str(self.get_tile(row, col))
+                                  for col in range(BOARD_SIZE))
+                         for row in range(BOARD_SIZE))
+
+    def __eq__(self, other):
+        return (isinstance(other, TwentyFortyEightBitboard) and
+                self._board == other._board)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._board)
+
+    def get_grid_height(self):
+        """
+        Get the height of the board.
+        """
+        return BOARD_SIZE
+
+    def get_grid_width(self):
+        """
+        Get the width of the board.
+        """
+        return BOARD_SIZE
+
+    def get_board(self):
+        """
+        Return the packed 64 bit board.
+        """
+        return self._board
+
+    def set_board(self, board):
+        """
+        Replace the whole grid with a packed 64 bit board.
+        """
+        self._board = board
+
+    def move(self, direction):
+        """
+        Move all tiles in the given direction and add
+        a new tile if any tiles moved.
+        """
+        board = move_board(self._board, direction)
+        if board != self._board:
+            self._board = board
+            self.new_tile()
+
+    def new_tile(self):
+        """
+        Create a new tile in a randomly selected empty
+        square.  The tile should be 2 90% of the time and
+        4 10% of the time.
+        """
+        board = self._board
+        empty = [shift for shift in range(0, 64, 4) if not (board >> shift) & 0xF]
+        if not empty:
+            raise ValueError("no empty square for a new tile")
+        exponent = 2 if random.random() <= .1 else 1
+        self._board = board | (exponent << random.choice(empty))
+
+    def set_tile(self, row, col, value):
+        """
+        Set the tile at position row, col to have the given value.
+        """
+        if value not in TILE_EXPONENTS:
+            raise ValueError("tile value cannot be packed: %r" % (value,))
+        shift = 4 * (BOARD_SIZE * row + col)
+        self._board = ((self._board & ~(0xF << shift)) |
+                       (TILE_EXPONENTS[value] << shift))
+
+    def get_tile(self, row, col):
+        """
+        Return the value of the tile at position row, col.
+        """
+        return TILE_VALUES[(self._board >> (4 * (BOARD_SIZE * row + col))) & 0xF]
+
+
+"""
+Expectimax player.
+
+Searches packed boards: max nodes try each direction through
+move_board(), chance nodes average over every empty square receiving
+a 2 (90%) or a 4 (10%).  Leaves are scored by a heuristic summed over
+rows and columns from a lazily built per-line table.
+"""
+
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+PROB_TWO = 0.9
+PROB_FOUR = 0.1
+
+# Heuristic weights for a single line.
+SCORE_LOST_PENALTY = 200000.0
+SCORE_MONOTONICITY_POWER = 4.0
+SCORE_MONOTONICITY_WEIGHT = 47.0
+SCORE_SUM_POWER = 3.5
+SCORE_SUM_WEIGHT = 11.0
+SCORE_MERGES_WEIGHT = 700.0
+SCORE_EMPTY_WEIGHT = 270.0
+
+_HEURISTIC_TABLE = []
+
+
+def _line_heuristic(packed):
+    """
+    Heuristic score of a single packed line: rewards empty squares,
+    adjacent equal tiles and monotonic lines.
+    """
+    line = [(packed >> (4 * index)) & 0xF for index in range(BOARD_SIZE)]
+    tile_sum = sum(exponent ** SCORE_SUM_POWER for exponent in line)
+    empty = line.count(0)
+
+    merges = 0
+    previous = 0
+    counter = 0
+    for exponent in line:
+        if exponent == 0:
+            continue
+        if exponent == previous:
+            counter += 1
+        elif counter > 0:
+            merges += 1 + counter
+            counter = 0
+        previous = exponent
+    if counter > 0:
+        merges += 1 + counter
+
+    monotonicity_left = 0.0
+    monotonicity_right = 0.0
+    for index in range(1, BOARD_SIZE):
+        before = line[index - 1] ** SCORE_MONOTONICITY_POWER
+        after = line[index] ** SCORE_MONOTONICITY_POWER
+        if line[index - 1] > line[index]:
+            monotonicity_left += before - after
+        else:
+            monotonicity_right += after - before
+
+    return (SCORE_LOST_PENALTY + SCORE_EMPTY_WEIGHT * empty +
+            SCORE_MERGES_WEIGHT * merges -
+            SCORE_MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right) -
+            SCORE_SUM_WEIGHT * tile_sum)
+
+
+def score_board(board):
+    """
+    Heuristic score of a packed board, summed over rows and columns.
+    """
+    if not _HEURISTIC_TABLE:
+        _HEURISTIC_TABLE.extend(_line_heuristic(packed) for packed in range(1 << 16))
+    table = _HEURISTIC_TABLE
+    columns = transpose(board)
+    return (table[board & ROW_MASK] + table[(board >> 16) & ROW_MASK] +
+            table[(board >> 32) & ROW_MASK] + table[(board >> 48) & ROW_MASK] +
+            table[columns & ROW_MASK] + table[(columns >> 16) & ROW_MASK] +
+            table[(columns >> 32) & ROW_MASK] + table[(columns >> 48) & ROW_MASK])
+
+
+def pack_game(game):
+    """
+    Return the packed board for any 4x4 game exposing get_tile().
+    """
+    if isinstance(game, TwentyFortyEightBitboard):
+        return game.get_board()
+    if game.get_grid_height() != BOARD_SIZE or game.get_grid_width() != BOARD_SIZE:
+        raise ValueError("expectimax only supports 4x4 games")
+    board = 0
+    for row in range(BOARD_SIZE):
+        packed = pack_line([game.get_tile(row, col) for col in range(BOARD_SIZE)])
+        if packed is None:
+            raise ValueError("tile values cannot be packed")
+        board |= packed << (16 * row)
+    return board
+
+
+class _SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget runs out.
+    """
+    pass
+
+
+class ExpectimaxPlayer:
+    """
+    Expectimax search for 4x4 games.
+
+    depth: number of moves to look ahead
+    cache_size: maximum number of transposition table entries
+    prob_threshold: chance branches less likely than this are
+                    scored by the heuristic instead of searched
+    time_budget: if given, seconds per move; the search deepens
+                 iteratively from depth 1 and returns the best move
+                 of the deepest search that finished in time
+    """
+
+    def __init__(self, depth=3, cache_size=200000, prob_threshold=0.0001,
+                 time_budget=None):
+        self._depth = depth
+        self._cache_size = cache_size
+        self._prob_threshold = prob_threshold
+        self._time_budget = time_budget
+        self._cache = collections.OrderedDict()
+        self._deadline = None
+        self._nodes = 0
+        self._lookups = 0
+        self._hits = 0
+        self._stats = {}
+
+    def __call__(self, game):
+        return self.get_move(game)
+
+    def clear_cache(self):
+        """
+        Empty the transposition table.
+        """
+        self._cache.clear()
+
+    def get_stats(self):
+        """
+        Return statistics for the last search as a dictionary with
+        depth, nodes, elapsed, nodes_per_sec, cache_lookups,
+        cache_hits, hit_rate and cache_entries.
+        """
+        return dict(self._stats)
+
+    def get_move(self, game):
+        """
+        Return the best direction for the given game, or None
+        if no direction changes the board.
+        """
+        board = pack_game(game)
+        self._nodes = 0
+        self._lookups = 0
+        self._hits = 0
+        start = time.time()
+
+        if self._time_budget is None:
+            self._deadline = None
+            best_move = self._search_root(board, self._depth)
+            depth = self._depth
+        else:
+            # Always finish depth 1 so there is a move to return.
+            self._deadline = None
+            best_move = self._search_root(board, 1)
+            depth = 1
+            self._deadline = start + self._time_budget
+            try:
+                while best_move is not None and time.time() < self._deadline:
+                    best_move = self._search_root(board, depth + 1)
+                    depth += 1
+            except _SearchTimeout:
+                pass
+            self._deadline = None
+
+        elapsed = time.time() - start
+        self._stats = {"depth": depth,
+                       "nodes": self._nodes,
+                       "elapsed": elapsed,
+                       "nodes_per_sec": self._nodes / elapsed if elapsed > 0 else 0.0,
+                       "cache_lookups": self._lookups,
+                       "cache_hits": self._hits,
+                       "hit_rate": float(self._hits) / self._lookups if self._lookups else 0.0,
+                       "cache_entries": len(self._cache)}
+        return best_move
+
+    def _search_root(self, board, depth):
+        """
+        Return the direction with the best expected score.
+        """
+        best_move = None
+        best_score = None
+        for direction in DIRECTIONS:
+            moved = move_board(board, direction)
+            if moved != board:
+                value = self._chance_node(moved, depth - 1, 1.0)
+                if best_score is None or value > best_score:
+                    best_score = value
+                    best_move = direction
+        return best_move
+
+    def _max_node(self, board, depth, prob):
+        """
+        Best expected score over all directions that change the board.
+        """
+        self._nodes += 1
+        if self._deadline is not None and time.time() > self._deadline:
+            raise _SearchTimeout()
+        best_score = 0.0
+        for direction in DIRECTIONS:
+            moved = move_board(board, direction)
+            if moved != board:
+                best_score = max(best_score, self._chance_node(moved, depth, prob))
+        return best_score
+
+    def _chance_node(self, board, depth, prob):
+        """
+        Expected score over every possible new tile.
+        """
+        if depth <= 0 or prob < self._prob_threshold:
+            return score_board(board)
+
+        key = (board, depth)
+        cache = self._cache
+        self._lookups += 1
+        if key in cache:
+            self._hits += 1
+            value = cache.pop(key)
+            cache[key] = value
+            return value
+
+        self._nodes += 1
+        empty = [shift for shift in range(0, 64, 4) if not (board >> shift) & 0xF]
+        prob_two = prob * PROB_TWO / len(empty)
+        prob_four = prob * PROB_FOUR / len(empty)
+        total = 0.0
+        for shift in empty:
+            total += PROB_TWO * self._max_node(board | (1 << shift), depth - 1, prob_two)
+            total += PROB_FOUR * self._max_node(board | (2 << shift), depth - 1, prob_four)
+        value = total / len(empty)
+
+        cache[key] = value
+        if len(cache) > self._cache_size:
+            cache.popitem(last=False)
+        return value
+
+
+def play_game(game, choose_move):
+    """
+    Play a game until choose_move(game) returns None or no longer
+    changes the board.  Returns the number of moves made.
+    """
+    moves = 0
+    while True:
+        direction = choose_move(game)
+        if direction is None:
+            return moves
+        board = [[game.get_tile(row, col) for col in range(game.get_grid_width())]
+                 for row in range(game.get_grid_height())]
+        game.move(direction)
+        if all(game.get_tile(row, col) == board[row][col]
+               for row in range(game.get_grid_height())
+               for col in range(game.get_grid_width())):
+            return moves
+        moves += 1
+
+
+"""
+Batched NumPy simulator.
+
+Holds many boards at once as an (N, height, width) array of uint8
+exponents (0 for an empty square) and moves all of them with array
+operations.  Each move views the boards as lines running in the
+OFFSETS direction, compresses and merges those lines, and spawns one
+tile on every board that changed, with a single RNG draw per batch.
+"""
+
+
+class BatchTwentyFortyEight:
+    """
+    Game logic for num_boards independent games advanced together.
+    Requires numpy.
+    """
+
+    def __init__(self, num_boards, grid_height, grid_width, seed=None):
+        if np is None:
+            raise ImportError("BatchTwentyFortyEight requires numpy")
+        self._num_boards = num_boards
+        self._height = grid_height
+        self._width = grid_width
+        self._rng = np.random.RandomState(seed)
+        self._exponents = np.zeros((num_boards, grid_height, grid_width), dtype=np.uint8)
+        self.reset()
+
+    def reset(self):
+        """
+        Reset every game so its grid is empty except for two
+        initial tiles.
+        """
+        self._exponents[...] = 0
+        every_board = np.ones(self._num_boards, dtype=bool)
+        self._spawn(every_board)
+        self._spawn(every_board)
+
+    def get_num_boards(self):
+        """
+        Get the number of boards in the batch.
+        """
+        return self._num_boards
+
+    def get_grid_height(self):
+        """
+        Get the height of the boards.
+        """
+        return self._height
+
+    def get_grid_width(self):
+        """
+        Get the width of the boards.
+        """
+        return self._width
+
+    def get_exponents(self):
+        """
+        Return the live (N, height, width) exponent array.
+        """
+        return self._exponents
+
+    def get_tile(self, index, row, col):
+        """
+        Return the value of the tile at position row, col of a board.
+        """
+        exponent = int(self._exponents[index, row, col])
+        return 1 << exponent if exponent else 0
+
+    def get_grid(self, index):
+        """
+        Return one board as a list of lists of tile values.
+        """
+        return [[self.get_tile(index, row, col) for col in range(self._width)]
+                for row in range(self._height)]
+
+    def move(self, direction):
+        """
+        Move all tiles of every board in the given direction and add
+        a new tile to each board where any tiles moved.
+
+        Returns a pair of arrays: a boolean mask of the boards that
+        changed and the score gained on each board by merges.
+        """
+        changed, scores = self._slide(direction)
+        self._spawn(changed)
+        return changed, scores
+
+    def _lines(self, direction):
+        """
+        Return a view of the boards as lines along the last axis,
+        each starting at the border tiles move towards.
+        """
+        row_step, col_step = OFFSETS[direction]
+        lines = self._exponents if row_step == 0 else self._exponents.transpose(0, 2, 1)
+        if row_step + col_step < 0:
+            lines = lines[:, :, ::-1]
+        return lines
+
+    def _slide(self, direction):
+        """
+        Compress and merge every line without spawning new tiles.
+        """
+        lines = self._lines(direction)
+        shape = lines.shape
+        work = np.ascontiguousarray(lines).reshape(-1, shape[2])
+        before = work.copy()
+        line_scores = np.zeros(work.shape[0], dtype=np.int64)
+
+        work = _compress(work)
+        for index in range(shape[2] - 1):
+            current = work[:, index]
+            merging = (current != 0) & (current == work[:, index + 1])
+            current[merging] += 1
+            line_scores += np.where(merging, np.left_shift(1, current.astype(np.int64)), 0)
+            work[merging, index + 1] = 0
+        work = _compress(work)
+
+        lines[...] = work.reshape(shape)
+        changed = (work != before).reshape(shape[0], -1).any(axis=1)
+        scores = line_scores.reshape(shape[0], shape[1]).sum(axis=1)
+        return changed, scores
+
+    def _spawn(self, mask):
+        """
+        Create a new tile in a uniformly chosen empty square of every
+        board selected by mask.  The tile should be 2 90% of the time
+        and 4 10% of the time.
+        """
+        flat = self._exponents.reshape(self._num_boards, -1)
+        empty = flat == 0
+        counts = empty.sum(axis=1)
+        draws = self._rng.random_sample((self._num_boards, 2))
+
+        picks = np.minimum((draws[:, 0] * counts).astype(np.int64), counts - 1)
+        cells = np.argmax(np.cumsum(empty, axis=1) > picks[:, np.newaxis], axis=1)
+        values = np.where(draws[:, 1] <= .1, 2, 1).astype(np.uint8)
+
+        boards = np.nonzero(mask & (counts > 0))[0]
+        flat[boards, cells[boards]] = values[boards]
+
+
+def _compress(work):
+    """
+    Slide the non-zero entries of every row of a 2D array to the
+    front, keeping their order.
+    """
+    order = np.argsort(work == 0, axis=1, kind="stable")
+    return np.take_along_axis(work, order, axis=1)
+
+
+"""
+Headless tournament runner.
+
+Plays many games of one policy across a process pool.  A policy is any
+picklable callable taking a TwentyFortyEight and returning a direction
+(or None to stop).  Every game gets its own seed drawn up front from
+the tournament seed, so results do not depend on how games are spread
+over workers.
+"""
+
+
+def random_policy(game):
+    """
+    Pick a uniformly random legal direction.
+    """
+    legal = game.legal_moves()
+    if not legal:
+        return None
+    return random.choice(legal)
+
+
+def _play_tournament_game(args):
+    """
+    Play one seeded game to the end and return its result.
+    """
+    policy, grid_height, grid_width, game_index, game_seed = args
+    start = time.time()
+    random.seed(game_seed)
+    game = TwentyFortyEight(grid_height, grid_width)
+    moves = 0
+    while not game.is_game_over():
+        direction = policy(game)
+        if direction not in game.legal_moves():
+            break
+        game.move(direction)
+        moves += 1
+    max_tile = max(max(game.get_tile(row, col) for col in range(grid_width))
+                   for row in range(grid_height))
+    return {"game": game_index,
+            "seed": game_seed,
+            "score": game.get_score(),
+            "max_tile": max_tile,
+            "moves": moves,
+            "wall_time": time.time() - start}
+
+
+def iter_tournament(policy, num_games, grid_height=4, grid_width=4,
+                    processes=None, seed=0, chunksize=None):
+    """
+    Play num_games games and yield each result dictionary (game,
+    seed, score, max_tile, moves, wall_time) as soon as it finishes,
+    in completion order.
+
+    processes: pool size, defaulting to the number of CPUs; 1 plays
+               every game in this process
+    chunksize: games handed to a worker at a time, defaulting to
+               about eight chunks per worker
+    """
+    seed_source = random.Random(seed)
+    jobs = [(policy, grid_height, grid_width, game_index, seed_source.getrandbits(32))
+            for game_index in range(num_games)]
+
+    if processes == 1:
+        for job in jobs:
+            yield _play_tournament_game(job)
+        return
+
+    import multiprocessing
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, num_games // (processes * 8))
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_play_tournament_game, jobs, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _distribution(values):
+    """
+    Summary statistics for a list of numbers.
+    """
+    ordered = sorted(values)
+    count = len(ordered)
+    mean = float(sum(ordered)) / count
+    variance = sum((value - mean) ** 2 for value in ordered) / count
+
+    def percentile(fraction):
+        """
+        Nearest-rank percentile of the sorted values.
+        """
+        return ordered[min(count - 1, int(fraction * count))]
+
+    return {"mean": mean,
+            "stdev": variance ** 0.5,
+            "min": ordered[0],
+            "p10": percentile(0.10),
+            "median": percentile(0.50),
+            "p90": percentile(0.90),
+            "max": ordered[-1]}
+
+
+def summarize_results(results):
+    """
+    Aggregate tournament results into distributions of score, moves
+    and wall time plus a count of games reaching each max tile.
+    """
+    results = list(results)
+    if not results:
+        return {"games": 0}
+    max_tiles = {}
+    for result in results:
+        max_tiles[result["max_tile"]] = max_tiles.get(result["max_tile"], 0) + 1
+    return {"games": len(results),
+            "score": _distribution([result["score"] for result in results]),
+            "moves": _distribution([result["moves"] for result in results]),
+            "wall_time": _distribution([result["wall_time"] for result in results]),
+            "max_tile": max_tiles}
+
+
+def run_tournament(policy, num_games, grid_height=4, grid_width=4,
+                   processes=None, seed=0, callback=None):
+    """
+    Play a whole tournament, calling callback(result) for each game
+    as it finishes.  Returns the list of results ordered by game
+    and their summary.
+    """
+    results = []
+    for result in iter_tournament(policy, num_games, grid_height, grid_width,
+                                  processes, seed):
+        if callback is not None:
+            callback(result)
+        results.append(result)
+    results.sort(key=lambda result: result["game"])
+    return results, summarize_results(results)
+
+
+def run_gui(grid_height=4, grid_width=4):
+    """
+    Start the interactive game.  The GUI module is only imported
+    here, so the game logic above can be imported without it.
+    """
+    import poc_2048_gui
+    poc_2048_gui.run_gui(TwentyFortyEight(grid_height, grid_width))
 
 
-poc_2048_gui.run_gui(TwentyFortyEight(4, 4))
+if __name__ == "__main__":
+    run_gui()
 
 
@@ -2,10 +2,18 @@
 Monte Carlo Tic-Tac-Toe Player
 """
 
+import math
+import pickle
 import random
-import poc_ttt_gui
+import time
+from array import array
 import poc_ttt_provided as provided
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Constants for Monte Carlo simulator
 # You may change the values of these constants as desired, but
 #  do not change their names.
@@ -54,18 +62,22 @@ def mc_update_scores(scores, board, player):
     elif check_winner == provided.switch_player(player):
         machine_score = -SCORE_CURRENT
         other_score = SCORE_OTHER      
+    else:
+        return
         
     board_size = board.get_dim()
+    other = provided.switch_player(player)
     
     for dummy_row in range(board_size):
         for dummy_col in range(board_size):
             
-            if board.square(dummy_row, dummy_col) == player:
+            square = board.square(dummy_row, dummy_col)
+            if square == player:
                 scores[dummy_row][dummy_col] += machine_score
-            elif board.square(dummy_row, dummy_col) == provided.switch_player(player):
+            elif square == other:
                 scores[dummy_row][dummy_col] += other_score
         
-def get_best_move(board, scores):
+def get_best_move(board, scores, rng=random):
     
     """
     This function takes a current board and a grid of scores. The function should find all 
@@ -73,22 +85,183 @@ def get_best_move(board, scores):
     (row, column) tuple. It is an error to call this function with a board that has no empty 
     squares (there is no possible next move), so your function may do whatever it wants in 
     that case. The case where the board is full will not be tested.
+
+    Ties are broken with rng, the random module unless a seeded
+    random.Random is given.
     """
     available_moves = board.get_empty_squares()
-    board_size = board.get_dim()
-    best_move = []
-    maximum = 0
-    
-    for dummy_row in range(board_size):
-        for dummy_col in range(board_size):
-        
-            if scores[dummy_row][dummy_col] > maximum and (dummy_row, dummy_col) in available_moves:
-                maximum = scores[dummy_row][dummy_col]
-                best_move = [(dummy_row,dummy_col)]
-            elif scores[dummy_row][dummy_col] == maximum and (dummy_row, dummy_col) in available_moves:
-                best_move.append((dummy_row,dummy_col))
+    maximum = max(scores[dummy_row][dummy_col] for dummy_row, dummy_col in available_moves)
+    best_move = [(dummy_row, dummy_col) for dummy_row, dummy_col in available_moves
+                 if scores[dummy_row][dummy_col] == maximum]
             
-    return random.choice(best_move)
+    return rng.choice(best_move)
+
+
+"""
+Compact board for fast playouts.
+
+Squares are held in a flat bytearray indexed row * dim + col, using
+the provided EMPTY/PLAYERX/PLAYERO values.  A precomputed table lists
+the winning lines through each square, so after a move only the lines
+through that square are checked.
+"""
+
+_WIN_LINES = {}
+
+
+def get_win_lines(dim):
+    """
+    Return a list giving, for every flat square index of a dim x dim
+    board, the tuple of winning lines (tuples of indices) through it.
+    """
+    if dim not in _WIN_LINES:
+        lines = [tuple(row * dim + col for col in range(dim)) for row in range(dim)]
+        lines += [tuple(row * dim + col for row in range(dim)) for col in range(dim)]
+        lines.append(tuple(idx * dim + idx for idx in range(dim)))
+        lines.append(tuple(idx * dim + dim - 1 - idx for idx in range(dim)))
+        _WIN_LINES[dim] = [tuple(line for line in lines if square in line)
+                           for square in range(dim * dim)]
+    return _WIN_LINES[dim]
+
+
+def pack_board(board):
+    """
+    Return the squares of a board as a flat bytearray.
+    """
+    dim = board.get_dim()
+    return bytearray(board.square(row, col) for row in range(dim) for col in range(dim))
+
+
+def is_reversed(board):
+    """
+    Return True if the board plays the reversed game, where completing
+    a line loses.  Probed through the public API: on an unfinished
+    board, filling every empty square with one player completes a line
+    for that player unless every line is already blocked.
+    """
+    for player in (provided.PLAYERX, provided.PLAYERO):
+        probe = board.clone()
+        for row, col in probe.get_empty_squares():
+            probe.move(row, col, player)
+        winner = probe.check_win()
+        if winner in (provided.PLAYERX, provided.PLAYERO):
+            return winner != player
+    return False
+
+
+def compact_trial(cells, dim, player, rng=random):
+    """
+    Play random moves on an unfinished flat board, modified in place,
+    starting with player.  Returns the player who completed a line,
+    or DRAW if the board filled up first.
+    """
+    lines = get_win_lines(dim)
+    empty = [square for square in range(len(cells)) if cells[square] == provided.EMPTY]
+
+    while empty:
+        index = rng.randrange(len(empty))
+        square = empty[index]
+        empty[index] = empty[-1]
+        empty.pop()
+        cells[square] = player
+        for line in lines[square]:
+            for other in line:
+                if cells[other] != player:
+                    break
+            else:
+                return player
+        player = provided.switch_player(player)
+
+    return provided.DRAW
+
+
+def compact_update_scores(scores, cells, dim, winner, player):
+    """
+    Same as mc_update_scores, for a completed flat board whose
+    winner is already known.
+    """
+    if winner == player:
+        machine_score = SCORE_CURRENT
+        other_score = -SCORE_OTHER
+    elif winner == provided.switch_player(player):
+        machine_score = -SCORE_CURRENT
+        other_score = SCORE_OTHER
+    else:
+        return
+
+    for square in range(len(cells)):
+        if cells[square] == player:
+            scores[square // dim][square % dim] += machine_score
+        elif cells[square] != provided.EMPTY:
+            scores[square // dim][square % dim] += other_score
+
+
+def run_compact_trials(scores, cells, dim, player, reverse, trials, rng=random):
+    """
+    Play trials random games from a flat board and add their results
+    to the scores grid.  reverse tells whether completing a line loses.
+    """
+    for dummy in range(trials):
+        trial_cells = cells[:]
+        winner = compact_trial(trial_cells, dim, player, rng)
+        if reverse and winner != provided.DRAW:
+            winner = provided.switch_player(winner)
+        compact_update_scores(scores, trial_cells, dim, winner, player)
+
+
+"""
+Vectorized scoring.
+
+With numpy, finished trial boards are stacked into a (trials, squares)
+array and scored in one step: each trial's weight for the machine
+player and for the other player is multiplied by masks of who owns
+which square and summed into a flat score array.  The best move is a
+masked argmax over the empty squares.
+"""
+
+
+def play_compact_trials(cells, dim, player, reverse, trials, rng=random):
+    """
+    Play trials random games from a flat board.  Returns a
+    (trials, dim * dim) uint8 array of finished boards and an array
+    of their winners (or DRAW).  Requires numpy.
+    """
+    finished = bytearray()
+    winners = []
+    for dummy in range(trials):
+        trial_cells = cells[:]
+        winner = compact_trial(trial_cells, dim, player, rng)
+        if reverse and winner != provided.DRAW:
+            winner = provided.switch_player(winner)
+        finished += trial_cells
+        winners.append(winner)
+    finished = np.frombuffer(bytes(finished), dtype=np.uint8).reshape(trials, len(cells))
+    return finished, np.array(winners, dtype=np.uint8)
+
+
+def accumulate_scores(scores, finished, winners, player):
+    """
+    Same as mc_update_scores for a whole batch of finished flat boards,
+    adding into a flat numpy score array.
+    """
+    other = provided.switch_player(player)
+    machine_weight = np.where(winners == player, SCORE_CURRENT,
+                              np.where(winners == other, -SCORE_CURRENT, 0.0))
+    other_weight = np.where(winners == player, -SCORE_OTHER,
+                            np.where(winners == other, SCORE_OTHER, 0.0))
+    scores += machine_weight.dot(finished == player)
+    scores += other_weight.dot(finished == other)
+
+
+def get_best_move_flat(cells, scores, dim, rng=random):
+    """
+    Same as get_best_move for a flat board and flat numpy score array.
+    """
+    masked = np.where(np.frombuffer(bytes(cells), dtype=np.uint8) == provided.EMPTY,
+                      scores, -np.inf)
+    best = np.flatnonzero(masked == masked.max())
+    square = int(rng.choice(list(best)))
+    return square // dim, square % dim
 
 
 def mc_move(board, player, trials):
@@ -103,20 +276,723 @@ def mc_move(board, player, trials):
     
 
     init_scores = [[0 for dummy in range(board_size)] for dummy in range(board_size)]
-    
-    for dummy in range(trials):
-        board_clone = board.clone()
-        mc_trial(board_clone, player)
-        mc_update_scores(init_scores, board_clone, player)
+
+    # Play the trials on flat copies of the board rather than clones.
+    if board.check_win() is None:
+        cells = pack_board(board)
+        reverse = is_reversed(board)
+        if np is not None:
+            # Score every finished board in one batch.
+            finished, winners = play_compact_trials(cells, board_size, player,
+                                                    reverse, trials)
+            flat_scores = np.zeros(len(cells))
+            accumulate_scores(flat_scores, finished, winners, player)
+            return get_best_move_flat(cells, flat_scores, board_size)
+        run_compact_trials(init_scores, cells, board_size, player, reverse, trials)
         
     return get_best_move(board, init_scores)
 
 
 
 
+"""
+Parallel Monte Carlo player.
+
+Trials are split into a fixed number of shards, each with its own seed
+and score grid, so a given seed yields the same move however many
+worker processes run the shards.  The shard grids are summed at the end.
+"""
+
+MC_SHARDS = 16
+
+
+def _mc_shard(args):
+    """
+    Run one shard of trials on a flat board and return its score grid.
+    """
+    cells, dim, player, reverse, trials, seed = args
+    scores = [[0 for dummy in range(dim)] for dummy in range(dim)]
+    run_compact_trials(scores, cells, dim, player, reverse, trials, random.Random(seed))
+    return scores
+
+
+# Shared worker pool and its size, kept between moves
+_MC_POOL = [None, None]
+
+
+def get_mc_pool(workers=None):
+    """
+    Return the shared pool of worker processes used by
+    mc_move_parallel, starting it on first use or when a different
+    number of workers is asked for.
+    """
+    if _MC_POOL[0] is None or _MC_POOL[1] != workers:
+        close_mc_pool()
+        import multiprocessing
+        _MC_POOL[0] = multiprocessing.Pool(workers)
+        _MC_POOL[1] = workers
+    return _MC_POOL[0]
+
+
+def close_mc_pool():
+    """
+    Shut down the shared worker pool, if it is running.
+    """
+    if _MC_POOL[0] is not None:
+        _MC_POOL[0].terminate()
+        _MC_POOL[0].join()
+        _MC_POOL[0] = None
+        _MC_POOL[1] = None
+
+
+def mc_move_parallel(board, player, trials, workers=None, seed=None, shards=MC_SHARDS,
+                     pool=None):
+    """
+    Same as mc_move, with the trials spread over a pool of worker
+    processes.  workers defaults to the number of CPUs; 1 runs the
+    shards in this process.  Passing a seed makes the chosen move
+    reproducible.  The pool is pool if given, otherwise the shared
+    pool from get_mc_pool, so it is only started once per game.
+    """
+    board_size = board.get_dim()
+    scores = [[0 for dummy in range(board_size)] for dummy in range(board_size)]
+    rng = random.Random(seed)
+
+    if board.check_win() is None:
+        cells = pack_board(board)
+        reverse = is_reversed(board)
+        jobs = [(cells, board_size, player, reverse,
+                 trials // shards + (1 if shard < trials % shards else 0),
+                 rng.getrandbits(32))
+                for shard in range(shards)]
+
+        if pool is not None:
+            results = pool.map(_mc_shard, jobs)
+        elif workers == 1:
+            results = [_mc_shard(job) for job in jobs]
+        else:
+            results = get_mc_pool(workers).map(_mc_shard, jobs)
+
+        for shard_scores in results:
+            for row in range(board_size):
+                for col in range(board_size):
+                    scores[row][col] += shard_scores[row][col]
+
+    return get_best_move(board, scores, rng)
+
+
+"""
+Anytime Monte Carlo player.
+
+Keeps one score grid per board and runs trials in small batches until
+a deadline, so the best move so far can be read at any time.
+"""
+
+# Trials run between deadline checks.
+ANYTIME_BATCH = 16
+
+
+class AnytimeMCPlayer:
+    """
+    Monte Carlo search on a single board that can be extended with
+    more trials or stopped at any time.
+    """
+
+    def __init__(self, board, player):
+        self._board = board
+        self._player = player
+        self._dim = board.get_dim()
+        self._scores = [[0 for dummy in range(self._dim)] for dummy in range(self._dim)]
+        self._finished = board.check_win() is not None
+        self._cells = pack_board(board)
+        self._reverse = not self._finished and is_reversed(board)
+        self._trials = 0
+        self._elapsed = 0.0
+
+    def run_trials(self, trials):
+        """
+        Run a fixed number of additional trials.
+        """
+        start = time.time()
+        if not self._finished:
+            run_compact_trials(self._scores, self._cells, self._dim, self._player,
+                               self._reverse, trials)
+        self._trials += trials
+        self._elapsed += time.time() - start
+
+    def run_for(self, seconds):
+        """
+        Run trials until the given number of seconds has passed.
+        At least one batch of trials is always run.
+        """
+        deadline = time.time() + seconds
+        self.run_trials(ANYTIME_BATCH)
+        while time.time() < deadline:
+            self.run_trials(ANYTIME_BATCH)
+
+    def get_best_move(self):
+        """
+        Return the best move found so far as a (row, column) tuple.
+        """
+        return get_best_move(self._board, self._scores)
+
+    def get_scores(self):
+        """
+        Return a copy of the current score grid.
+        """
+        return [list(row) for row in self._scores]
+
+    def get_stats(self):
+        """
+        Return a dictionary with the trials run, the seconds spent,
+        and the best, runner-up and worst scores over the empty
+        squares along with their spread (best - worst).
+        """
+        empty_scores = sorted((self._scores[row][col]
+                               for row, col in self._board.get_empty_squares()),
+                              reverse=True)
+        stats = {"trials": self._trials, "elapsed": self._elapsed}
+        if empty_scores:
+            stats["best"] = empty_scores[0]
+            stats["runner_up"] = empty_scores[1] if len(empty_scores) > 1 else empty_scores[0]
+            stats["worst"] = empty_scores[-1]
+            stats["spread"] = empty_scores[0] - empty_scores[-1]
+        return stats
+
+
+def mc_move_timed(board, player, seconds):
+    """
+    Same as mc_move, but runs trials until a wall-clock budget of
+    the given number of seconds is spent instead of a fixed count.
+    """
+    searcher = AnytimeMCPlayer(board, player)
+    searcher.run_for(seconds)
+    return searcher.get_best_move()
+
+
+"""
+Monte Carlo Tree Search player.
+
+UCT search (UCB1 selection, random playouts) over a tree stored in
+parallel arrays indexed by node number rather than node objects.  The
+children of a node are allocated as one contiguous block.  The tree
+is kept between calls to mcts_move: when the next board is the root
+board plus our move and the opponent's reply, the matching grandchild
+becomes the new root and its subtree is compacted into fresh arrays.
+"""
+
+MCTS_NODE_LIMIT = 200000
+UCT_EXPLORATION = math.sqrt(2.0)
+
+# Node result: not finished, or the player who completed a line / DRAW.
+UNFINISHED = 0
+
+
+class MCTSTree:
+    """
+    Search tree for one game.  Each node records the square played to
+    reach it, the player who played it, its parent, its block of
+    children, its visit count and the wins of the player who moved
+    into it (draws count half).
+    """
+
+    def __init__(self, cells, dim, player, reverse, node_limit=MCTS_NODE_LIMIT,
+                 exploration=UCT_EXPLORATION):
+        self._dim = dim
+        self._reverse = reverse
+        self._node_limit = node_limit
+        self._exploration = exploration
+        self._root_cells = bytearray(cells)
+        self._root_player = player
+        self._clear()
+        self._add_node(-1, provided.switch_player(player), -1, UNFINISHED)
+
+    def _clear(self):
+        """
+        Start with empty node arrays.
+        """
+        self._root = 0
+        self._square = array("i")
+        self._mover = array("b")
+        self._parent = array("i")
+        self._first_child = array("i")
+        self._num_children = array("i")
+        self._result = array("b")
+        self._visits = array("i")
+        self._wins = array("d")
+
+    def _add_node(self, square, mover, parent, result):
+        """
+        Append an unexpanded, unvisited node.
+        """
+        self._square.append(square)
+        self._mover.append(mover)
+        self._parent.append(parent)
+        self._first_child.append(-1)
+        self._num_children.append(0)
+        self._result.append(result)
+        self._visits.append(0)
+        self._wins.append(0.0)
+
+    def get_node_count(self):
+        """
+        Return the number of nodes in the pool.
+        """
+        return len(self._square)
+
+    def get_root_visits(self):
+        """
+        Return the number of playouts through the root.
+        """
+        return self._visits[self._root]
+
+    def _expand(self, node, cells, player):
+        """
+        Give node one child per empty square, played by player, and
+        record which children end the game.
+        """
+        lines = get_win_lines(self._dim)
+        empty = [square for square in range(len(cells)) if cells[square] == provided.EMPTY]
+        self._first_child[node] = len(self._square)
+        self._num_children[node] = len(empty)
+        for square in empty:
+            cells[square] = player
+            result = UNFINISHED
+            for line in lines[square]:
+                for other in line:
+                    if cells[other] != player:
+                        break
+                else:
+                    result = player
+                    break
+            if result == UNFINISHED and len(empty) == 1:
+                result = provided.DRAW
+            cells[square] = provided.EMPTY
+            self._add_node(square, player, node, result)
+
+    def _select(self, node):
+        """
+        Return the child of node with the highest UCB1 value, or a
+        random unvisited child if there is one.
+        """
+        first = self._first_child[node]
+        children = range(first, first + self._num_children[node])
+        unvisited = [child for child in children if self._visits[child] == 0]
+        if unvisited:
+            return random.choice(unvisited)
+
+        log_visits = math.log(self._visits[node])
+        best_child = first
+        best_value = None
+        for child in children:
+            visits = self._visits[child]
+            value = (self._wins[child] / visits +
+                     self._exploration * math.sqrt(log_visits / visits))
+            if best_value is None or value > best_value:
+                best_value = value
+                best_child = child
+        return best_child
+
+    def search(self, playouts):
+        """
+        Run the given number of select / expand / playout / update
+        iterations from the root.
+        """
+        for dummy in range(playouts):
+            cells = self._root_cells[:]
+            node = self._root
+            player = self._root_player
+
+            # Selection: walk down expanded nodes, playing their squares.
+            while self._first_child[node] >= 0 and self._result[node] == UNFINISHED:
+                node = self._select(node)
+                cells[self._square[node]] = player
+                player = provided.switch_player(player)
+
+            # Expansion, while the node pool has room.
+            winner = self._result[node]
+            if winner == UNFINISHED and len(self._square) < self._node_limit:
+                self._expand(node, cells, player)
+                node = self._select(node)
+                cells[self._square[node]] = player
+                player = provided.switch_player(player)
+                winner = self._result[node]
+
+            # Playout.
+            if winner == UNFINISHED:
+                winner = compact_trial(cells, self._dim, player)
+            if self._reverse and winner != provided.DRAW:
+                winner = provided.switch_player(winner)
+
+            # Update every node on the path.
+            while node >= 0:
+                self._visits[node] += 1
+                if winner == self._mover[node]:
+                    self._wins[node] += 1.0
+                elif winner == provided.DRAW:
+                    self._wins[node] += 0.5
+                node = self._parent[node]
+
+    def best_move(self):
+        """
+        Return the most visited root move as a (row, column) tuple,
+        breaking ties at random, or None if the root is unexpanded.
+        """
+        first = self._first_child[self._root]
+        if first < 0:
+            return None
+        children = range(first, first + self._num_children[self._root])
+        most = max(self._visits[child] for child in children)
+        square = self._square[random.choice([child for child in children
+                                             if self._visits[child] == most])]
+        return square // self._dim, square % self._dim
+
+    def _find_child(self, node, square):
+        """
+        Return the child of node reached by playing square, or -1.
+        """
+        first = self._first_child[node]
+        if first < 0:
+            return -1
+        for child in range(first, first + self._num_children[node]):
+            if self._square[child] == square:
+                return child
+        return -1
+
+    def advance_to(self, cells, player, reverse):
+        """
+        Re-root the tree at the given board if it is the root board,
+        or the root board after the root player's move and one reply,
+        under the same rules.  Returns False if the tree cannot be
+        reused.
+        """
+        if (player != self._root_player or reverse != self._reverse
+                or len(cells) != len(self._root_cells)):
+            return False
+        changed = [square for square in range(len(cells))
+                   if cells[square] != self._root_cells[square]]
+        if not changed:
+            return True
+        if len(changed) != 2 or any(self._root_cells[square] != provided.EMPTY
+                                    for square in changed):
+            return False
+
+        ours = [square for square in changed if cells[square] == player]
+        theirs = [square for square in changed
+                  if cells[square] == provided.switch_player(player)]
+        if len(ours) != 1 or len(theirs) != 1:
+            return False
+        child = self._find_child(self._root, ours[0])
+        grandchild = self._find_child(child, theirs[0]) if child >= 0 else -1
+        if grandchild < 0:
+            return False
+
+        self._compact(grandchild)
+        self._root_cells = bytearray(cells)
+        return True
+
+    def _compact(self, new_root):
+        """
+        Copy the subtree under new_root into fresh arrays, dropping
+        every other node, and make it the root.
+        """
+        old = (self._square, self._mover, self._first_child, self._num_children,
+               self._result, self._visits, self._wins)
+        old_square, old_mover, old_first, old_count, old_result, old_visits, old_wins = old
+        self._clear()
+
+        queue = [(new_root, -1)]
+        self._add_node(old_square[new_root], old_mover[new_root], -1, old_result[new_root])
+        self._visits[0] = old_visits[new_root]
+        self._wins[0] = old_wins[new_root]
+        position = 0
+        while position < len(queue):
+            old_node, dummy = queue[position]
+            new_node = position
+            position += 1
+            first = old_first[old_node]
+            if first < 0:
+                continue
+            self._first_child[new_node] = len(self._square)
+            self._num_children[new_node] = old_count[old_node]
+            for old_child in range(first, first + old_count[old_node]):
+                self._add_node(old_square[old_child], old_mover[old_child], new_node,
+                               old_result[old_child])
+                self._visits[-1] = old_visits[old_child]
+                self._wins[-1] = old_wins[old_child]
+                queue.append((old_child, new_node))
+
+
+# Trees kept between calls to mcts_move, by (dim, player, reverse), so
+# one function playing both sides keeps a tree for each.
+_MCTS_TREES = {}
+
+
+def mcts_move(board, player, trials):
+    """
+    Same as mc_move, choosing the move by Monte Carlo Tree Search
+    with trials playouts.  Each side's search tree is reused across
+    its calls within one game.
+    """
+    if board.check_win() is not None:
+        board_size = board.get_dim()
+        return get_best_move(board, [[0] * board_size for dummy in range(board_size)])
+
+    cells = pack_board(board)
+    reverse = is_reversed(board)
+    key = (board.get_dim(), player, reverse)
+    tree = _MCTS_TREES.get(key)
+    if tree is None or not tree.advance_to(cells, player, reverse):
+        tree = MCTSTree(cells, board.get_dim(), player, reverse)
+        _MCTS_TREES[key] = tree
+    tree.search(trials)
+    return tree.best_move()
+
+
+"""
+Exact solver.
+
+Negamax search with alpha-beta pruning over flat boards.  Positions
+are stored in a transposition table under a canonical key: a Zobrist
+hash is kept incrementally for each of the 8 symmetries of the square
+(4 rotations, each optionally mirrored) and the smallest of the 8
+identifies the whole symmetry class.  The Zobrist values come from a
+fixed seed, so tables saved to disk stay valid across runs.
+
+Values are from the side to move: a win scores 1 plus the number of
+squares still empty, so faster wins and slower losses are preferred,
+and a draw scores 0.
+"""
+
+ZOBRIST_SEED = 2048
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+def get_symmetries(dim):
+    """
+    Return the 8 symmetries of a dim x dim board, each a list mapping
+    a flat square index to its image.
+    """
+    def rotate(row, col):
+        """
+        Rotate a square a quarter turn clockwise.
+        """
+        return col, dim - 1 - row
+
+    symmetries = []
+    for mirror in (False, True):
+        for turns in range(4):
+            image = []
+            for square in range(dim * dim):
+                row, col = square // dim, square % dim
+                if mirror:
+                    col = dim - 1 - col
+                for dummy in range(turns):
+                    row, col = rotate(row, col)
+                image.append(row * dim + col)
+            symmetries.append(image)
+    return symmetries
+
+
+class MinimaxSolver:
+    """
+    Perfect player for one board size and rule set (reverse or not),
+    with a transposition table that can be saved and loaded.
+    """
+
+    def __init__(self, dim, reverse=False):
+        self._dim = dim
+        self._reverse = reverse
+        self._table = {}
+        self._nodes = 0
+
+        rng = random.Random(ZOBRIST_SEED + dim)
+        zobrist = [dict((player, rng.getrandbits(64))
+                        for player in (provided.PLAYERX, provided.PLAYERO))
+                   for dummy in range(dim * dim)]
+        symmetries = get_symmetries(dim)
+        # For each square and player, the key bits under every symmetry.
+        self._keys = [dict((player, tuple(zobrist[image[square]][player]
+                                          for image in symmetries))
+                           for player in (provided.PLAYERX, provided.PLAYERO))
+                      for square in range(dim * dim)]
+        self._side_key = rng.getrandbits(64)
+
+        # Try squares on more lines first.
+        lines = get_win_lines(dim)
+        self._order = sorted(range(dim * dim), key=lambda square: -len(lines[square]))
+
+    def get_table_size(self):
+        """
+        Return the number of positions in the transposition table.
+        """
+        return len(self._table)
+
+    def _hashes(self, cells):
+        """
+        Return the Zobrist hashes of a board under every symmetry.
+        """
+        hashes = [0] * 8
+        for square in range(len(cells)):
+            if cells[square] != provided.EMPTY:
+                keys = self._keys[square][cells[square]]
+                for index in range(8):
+                    hashes[index] ^= keys[index]
+        return hashes
+
+    def solve(self, cells, player):
+        """
+        Return the value of an unfinished flat board for the player
+        to move.
+        """
+        empty = sum(1 for value in cells if value == provided.EMPTY)
+        return self._negamax(bytearray(cells), player, self._hashes(cells), empty,
+                             -len(cells) - 1, len(cells) + 1)
+
+    def move_values(self, cells, player):
+        """
+        Return a dictionary mapping every empty square of an unfinished
+        flat board to its value for player.
+        """
+        cells = bytearray(cells)
+        hashes = self._hashes(cells)
+        empty = sum(1 for value in cells if value == provided.EMPTY)
+        return dict((square, self._child_value(cells, player, hashes, empty, square,
+                                               -len(cells) - 1, len(cells) + 1))
+                    for square in range(len(cells)) if cells[square] == provided.EMPTY)
+
+    def _child_value(self, cells, player, hashes, empty, square, alpha, beta):
+        """
+        Value for player of playing square, searched with the given
+        window.  cells and hashes are restored before returning.
+        """
+        cells[square] = player
+        value = None
+        for line in get_win_lines(self._dim)[square]:
+            for other in line:
+                if cells[other] != player:
+                    break
+            else:
+                value = empty if not self._reverse else -empty
+                break
+        if value is None:
+            if empty == 1:
+                value = 0
+            else:
+                keys = self._keys[square][player]
+                child_hashes = [hashes[index] ^ keys[index] for index in range(8)]
+                value = -self._negamax(cells, provided.switch_player(player),
+                                       child_hashes, empty - 1, -beta, -alpha)
+        cells[square] = provided.EMPTY
+        return value
+
+    def _negamax(self, cells, player, hashes, empty, alpha, beta):
+        """
+        Alpha-beta search of an unfinished board.
+        """
+        self._nodes += 1
+        key = min(hashes)
+        if player == provided.PLAYERO:
+            key ^= self._side_key
+
+        entry = self._table.get(key)
+        if entry is not None:
+            value, flag = entry
+            if flag == EXACT:
+                return value
+            if flag == LOWER_BOUND:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        original_alpha = alpha
+        best = -len(cells) - 1
+        for square in self._order:
+            if cells[square] != provided.EMPTY:
+                continue
+            value = self._child_value(cells, player, hashes, empty, square, alpha, beta)
+            if value > best:
+                best = value
+                if best > alpha:
+                    alpha = best
+                    if alpha >= beta:
+                        break
+
+        if best <= original_alpha:
+            flag = UPPER_BOUND
+        elif best >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self._table[key] = (best, flag)
+        return best
+
+    def save(self, path):
+        """
+        Write the transposition table to a file.
+        """
+        with open(path, "wb") as table_file:
+            pickle.dump((self._dim, self._reverse, self._table), table_file, 2)
+
+    def load(self, path):
+        """
+        Merge a transposition table saved by save() for the same
+        board size and rules.
+        """
+        with open(path, "rb") as table_file:
+            dim, reverse, table = pickle.load(table_file)
+        if dim != self._dim or reverse != self._reverse:
+            raise ValueError("table is for a different board size or rule set")
+        self._table.update(table)
+
+
+# Solvers by (dim, reverse), shared by every call to minimax_move.
+_SOLVERS = {}
+
+
+def get_solver(dim, reverse=False):
+    """
+    Return the shared solver for a board size and rule set.
+    """
+    if (dim, reverse) not in _SOLVERS:
+        _SOLVERS[(dim, reverse)] = MinimaxSolver(dim, reverse)
+    return _SOLVERS[(dim, reverse)]
+
+
+def minimax_move(board, player, trials):
+    """
+    Same as mc_move, but plays perfectly by searching the whole game
+    tree.  trials is ignored.  Among equally good moves one is
+    picked at random.
+    """
+    board_size = board.get_dim()
+    if board.check_win() is not None:
+        return get_best_move(board, [[0] * board_size for dummy in range(board_size)])
+
+    solver = get_solver(board_size, is_reversed(board))
+    values = solver.move_values(pack_board(board), player)
+    best = max(values.values())
+    square = random.choice([square for square in values if values[square] == best])
+    return square // board_size, square % board_size
+
+
+def run_gui(dim=3, player=provided.PLAYERX, trials=NTRIALS, reverse=False):
+    """
+    Play against the machine player in the GUI.  The GUI module is
+    only imported here, so the player above can be imported without it.
+    """
+    import poc_ttt_gui
+    poc_ttt_gui.run_gui(dim, player, mc_move, trials, reverse)
+
+
 # Test game with the console or the GUI.  Uncomment whichever 
 # you prefer.  Both should be commented out when you submit 
 # for testing to save time.
 
-# provided.play_game(mc_move, NTRIALS, False)        
-poc_ttt_gui.run_gui(3, provided.PLAYERX, mc_move, NTRIALS, False)
+if __name__ == "__main__":
+    # provided.play_game(mc_move, NTRIALS, False)        
+    run_gui()
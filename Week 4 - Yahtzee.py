@@ -1,11 +1,23 @@
 """
 Planner for Yahtzee
 Simplifications:  only allow discard and roll, only score against upper level
+(plan_turn below plans a whole three-roll turn against any score function)
 """
 
-# Used to increase the timeout, if necessary
-import codeskulptor
-codeskulptor.set_timeout(20)
+import collections
+import math
+import mmap
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Maximum number of expected values kept in the cache
+EV_CACHE_SIZE = 20000
 
 def gen_all_sequences(outcomes, length):
     """
@@ -25,6 +37,36 @@ def gen_all_sequences(outcomes, length):
     return answer_set
 
 
+def gen_sorted_sequences(outcomes, length):
+    """
+    Iterative function that enumerates the set of all sorted sequences
+    of outcomes of given length, one per multiset of outcomes.
+    """
+    
+    outcomes = sorted(set(outcomes))
+    # Each partial sequence is kept with the index of its last item,
+    # so it is only extended by items that keep it sorted
+    answer_list = [((), 0)]
+    for dummy_idx in range(length):
+        temp_list = []
+        for partial_sequence, start in answer_list:
+            for index in range(start, len(outcomes)):
+                temp_list.append((partial_sequence + (outcomes[index],), index))
+        answer_list = temp_list
+    return set(sequence for sequence, dummy_start in answer_list)
+
+
+def count_orderings(sequence):
+    """
+    Return the number of distinct orderings of a sequence, the
+    multinomial coefficient n! / (c1! * c2! * ...) of its item counts.
+    """
+    orderings = math.factorial(len(sequence))
+    for item in set(sequence):
+        orderings //= math.factorial(sequence.count(item))
+    return orderings
+
+
 def score(hand):
     """
     Compute the maximal score for a Yahtzee hand according to the
@@ -35,18 +77,90 @@ def score(hand):
     Returns an integer score 
     """
     
-    max_score = []
+    # One pass to count each face, instead of hand.count per die
+    counts = {}
     
     for dice in hand:
-        max_score.append(hand.count(dice) * dice)
+        counts[dice] = counts.get(dice, 0) + 1
     
-    return max(max_score)
+    return max([count * dice for dice, count in counts.items()])
+
+
+def score_batch(hands, num_die_sides):
+    """
+    Compute score() for many hands at once.  Requires numpy.
+
+    hands: array-like of shape (number of hands, dice per hand)
+    num_die_sides: number of sides on each die
+
+    Returns an integer array of upper section scores
+    """
+    hands = np.asarray(hands, dtype=np.int64)
+    num_hands = hands.shape[0]
+    bins = num_die_sides + 1
+    if hands.size:
+        if hands.min() < 0:
+            raise ValueError("dice faces must not be negative")
+        # Faces above num_die_sides would spill into the next hand's bins
+        bins = max(bins, int(hands.max()) + 1)
+    # Count histogram per hand in one bincount, offsetting each hand's
+    # faces into its own block of bins
+    offsets = (np.arange(num_hands, dtype=np.int64) * bins)[:, np.newaxis]
+    counts = np.bincount((hands + offsets).ravel(),
+                         minlength=num_hands * bins).reshape(num_hands, bins)
+    return (counts * np.arange(bins)).max(axis=1)
     
     
     
     
 
 
+# Sorted rolls with their number of orderings by (num_die_sides,
+# num_free_dice), and cached expected
+# values by (sorted held dice, num_die_sides, num_free_dice) in LRU order
+_OUTCOMES = {}
+_OUTCOME_ARRAYS = {}
+_EV_CACHE = collections.OrderedDict()
+
+
+def get_outcomes(num_die_sides, num_free_dice):
+    """
+    Return a list of (roll, orderings) pairs covering every sorted roll
+    of num_free_dice dice with num_die_sides sides, where orderings is
+    the number of ordered rolls it stands for.  Computed once per pair.
+    """
+    key = (num_die_sides, num_free_dice)
+    if key not in _OUTCOMES:
+        die_sides = [(die + 1) for die in range(num_die_sides)]
+        _OUTCOMES[key] = [(outcome, count_orderings(outcome))
+                          for outcome in gen_sorted_sequences(die_sides, num_free_dice)]
+    return _OUTCOMES[key]
+
+
+def get_outcome_arrays(num_die_sides, num_free_dice):
+    """
+    Return get_outcomes as a pair of numpy arrays: the sorted rolls,
+    one per row, and their numbers of orderings.
+    """
+    key = (num_die_sides, num_free_dice)
+    if key not in _OUTCOME_ARRAYS:
+        pos_outcomes = get_outcomes(num_die_sides, num_free_dice)
+        rolls = np.array([outcome for outcome, dummy in pos_outcomes],
+                         dtype=np.int64).reshape(len(pos_outcomes), num_free_dice)
+        orderings = np.array([count for dummy, count in pos_outcomes], dtype=np.int64)
+        _OUTCOME_ARRAYS[key] = (rolls, orderings)
+    return _OUTCOME_ARRAYS[key]
+
+
+def clear_caches():
+    """
+    Empty the outcome and expected value caches.
+    """
+    _OUTCOMES.clear()
+    _OUTCOME_ARRAYS.clear()
+    _EV_CACHE.clear()
+
+
 def expected_value(held_dice, num_die_sides, num_free_dice):
     """
     Compute the expected value based on held_dice given that there
@@ -59,17 +173,36 @@ def expected_value(held_dice, num_die_sides, num_free_dice):
     Returns a floating point expected value
     """
     
-    scores = []
-    
-    die_sides = [(die + 1) for die in range(num_die_sides)]
-    
-    pos_outcomes = gen_all_sequences(die_sides, num_free_dice)
+    # Scores do not depend on dice order, so sorted holds share entries
+    held_dice = tuple(sorted(held_dice))
+    key = (held_dice, num_die_sides, num_free_dice)
+    if key in _EV_CACHE:
+        expected_result = _EV_CACHE.pop(key)
+        _EV_CACHE[key] = expected_result
+        return expected_result
 
-    for outcome in pos_outcomes:
-        scores.append(score(held_dice + outcome))
+    # Score each sorted roll once, weighted by its number of orderings,
+    # instead of every one of the num_die_sides ** num_free_dice rolls
+    if np is not None:
+        # Score every roll in one batch
+        rolls, orderings = get_outcome_arrays(num_die_sides, num_free_dice)
+        held = np.tile(np.array(held_dice, dtype=np.int64), (len(rolls), 1))
+        hands = np.hstack([held.reshape(len(rolls), len(held_dice)), rolls])
+        total_score = int(orderings.dot(score_batch(hands, num_die_sides)))
+    else:
+        total_score = 0
         
-    expected_result = float(sum(scores))/len(scores)
+        pos_outcomes = get_outcomes(num_die_sides, num_free_dice)
+
+        for outcome, orderings in pos_outcomes:
+            total_score += orderings * score(held_dice + outcome)
+        
+    expected_result = float(total_score) / num_die_sides ** num_free_dice
     
+    _EV_CACHE[key] = expected_result
+    if len(_EV_CACHE) > EV_CACHE_SIZE:
+        _EV_CACHE.popitem(last=False)
+
     return expected_result
     
     
@@ -83,14 +216,36 @@ def gen_all_holds(hand):
     Returns a set of tuples, where each tuple is dice to hold
     """
     
-    held_dice = [()]
-    
+    return set(iter_holds(hand))
+
+
+def iter_holds(hand):
+    """
+    Generate every distinct choice of dice from hand to hold exactly
+    once, as a sorted tuple, by choosing how many of each face to keep.
+
+    hand: full yahtzee hand
+    """
+    counts = {}
     for dice in hand:
-        for dummy_dice in held_dice:
-            held_dice = held_dice + [tuple(dummy_dice) + (dice, )]
-    
+        counts[dice] = counts.get(dice, 0) + 1
+    faces = sorted(counts)
+    kept = [0] * len(faces)
+
+    while True:
+        held_dice = ()
+        for face, number in zip(faces, kept):
+            held_dice += (face, ) * number
+        yield held_dice
 
-    return set(held_dice)
+        # Step to the next combination of kept counts, odometer style
+        index = 0
+        while index < len(faces) and kept[index] == counts[faces[index]]:
+            kept[index] = 0
+            index += 1
+        if index == len(faces):
+            return
+        kept[index] += 1
 
 
 
@@ -109,7 +264,7 @@ def strategy(hand, num_die_sides):
     best_hold = (0.0, ())
     current_score = 0
     
-    for held_dice in gen_all_holds(hand):
+    for held_dice in iter_holds(hand):
         score = expected_value(held_dice, num_die_sides, len(hand) - len(held_dice))
         if score > current_score:
             current_score = score
@@ -118,6 +273,222 @@ def strategy(hand, num_die_sides):
     return best_hold
     
 
+"""
+Full-turn planner.
+
+Plans a whole turn of several rolls by backward induction over
+(roll number, sorted hand) states: after the last roll a hand is worth
+score_function(hand), and after an earlier roll it is worth the best
+expected value over its holds of the hand reached by the next roll.
+The resulting policy can be written to a compact binary file and
+served from a memory map with one index computation per decision.
+"""
+
+ROLLS_PER_TURN = 3
+
+# Lower section scores
+FULL_HOUSE_SCORE = 25
+SMALL_STRAIGHT_SCORE = 30
+LARGE_STRAIGHT_SCORE = 40
+YAHTZEE_SCORE = 50
+
+# Policy file layout: header, then one hold mask byte per hand for each
+# decision roll, then one little-endian double per hand for each roll
+POLICY_MAGIC = b"YTZP"
+POLICY_HEADER = struct.Struct("<4sHHH")
+POLICY_VALUE = struct.Struct("<d")
+
+# Hold masks are stored in one byte
+POLICY_MAX_DICE = 8
+
+
+def score_full(hand):
+    """
+    Compute the maximal score for a Yahtzee hand over the upper and
+    lower sections of the Yahtzee score card.
+
+    hand: full yahtzee hand
+
+    Returns an integer score
+    """
+    counts = [hand.count(dice) for dice in set(hand)]
+    total = sum(hand)
+    # Chance, three and four of a kind all score the total
+    best = max([score(hand), total])
+    
+    if sorted(counts) == [2, 3]:
+        best = max(best, FULL_HOUSE_SCORE)
+    if len(counts) == 1 and len(hand) > 1:
+        best = max(best, YAHTZEE_SCORE)
+
+    # Longest run of consecutive faces
+    faces = sorted(set(hand))
+    longest = run = 1
+    for index in range(1, len(faces)):
+        run = run + 1 if faces[index] == faces[index - 1] + 1 else 1
+        longest = max(longest, run)
+    if longest >= 5:
+        best = max(best, LARGE_STRAIGHT_SCORE)
+    elif longest >= 4:
+        best = max(best, SMALL_STRAIGHT_SCORE)
+    
+    return best
+
+
+def hold_mask(hand, held_dice):
+    """
+    Return a bit mask of the positions of sorted hand kept by the
+    sorted hold held_dice, taking the first position of each die.
+    """
+    mask = 0
+    position = 0
+    for dice in held_dice:
+        while hand[position] != dice:
+            position += 1
+        mask |= 1 << position
+        position += 1
+    return mask
+
+
+def apply_mask(hand, mask):
+    """
+    Return the dice of sorted hand selected by a hold mask.
+    """
+    return tuple(dice for position, dice in enumerate(hand) if mask >> position & 1)
+
+
+def hand_rank(hand, num_die_sides):
+    """
+    Return the position of a sorted hand among all sorted hands of
+    its length in lexicographic order.
+    """
+    def count_sorted(length, lowest):
+        """
+        Number of sorted hands of length dice with faces in
+        lowest..num_die_sides.
+        """
+        sides = num_die_sides - lowest + 1
+        return (math.factorial(length + sides - 1) //
+                (math.factorial(length) * math.factorial(sides - 1)))
+
+    rank = 0
+    lowest = 1
+    for position, dice in enumerate(hand):
+        remaining = len(hand) - position - 1
+        for smaller in range(lowest, dice):
+            rank += count_sorted(remaining, smaller)
+        lowest = dice
+    return rank
+
+
+def plan_turn(num_dice, num_die_sides, score_function=score_full, rolls=ROLLS_PER_TURN):
+    """
+    Compute the optimal holds for a whole turn.
+
+    Returns a tuple (hands, holds, values) where hands is the sorted
+    list of sorted hands, holds[roll - 1][index] is the hold mask to
+    use for hands[index] after roll number roll (1 to rolls - 1), and
+    values[roll - 1][index] is its expected final score.
+    """
+    die_sides = [(die + 1) for die in range(num_die_sides)]
+    hands = sorted(gen_sorted_sequences(die_sides, num_dice))
+    index_of = dict((hand, index) for index, hand in enumerate(hands))
+    total_rolls = dict((free, float(num_die_sides ** free)) for free in range(num_dice + 1))
+
+    values = [[float(score_function(hand)) for hand in hands]]
+    holds = []
+    for dummy_roll in range(rolls - 1):
+        next_values = values[0]
+        hold_values = {}
+        roll_values = []
+        roll_holds = []
+        for hand in hands:
+            best_value = None
+            best_hold = ()
+            for held_dice in iter_holds(hand):
+                if held_dice not in hold_values:
+                    free_dice = num_dice - len(held_dice)
+                    total = 0.0
+                    for outcome, orderings in get_outcomes(num_die_sides, free_dice):
+                        next_hand = tuple(sorted(held_dice + outcome))
+                        total += orderings * next_values[index_of[next_hand]]
+                    hold_values[held_dice] = total / total_rolls[free_dice]
+                if best_value is None or hold_values[held_dice] > best_value:
+                    best_value = hold_values[held_dice]
+                    best_hold = held_dice
+            roll_values.append(best_value)
+            roll_holds.append(hold_mask(hand, best_hold))
+        values.insert(0, roll_values)
+        holds.insert(0, roll_holds)
+
+    return hands, holds, values
+
+
+def write_policy(path, num_dice=5, num_die_sides=6, score_function=score_full,
+                 rolls=ROLLS_PER_TURN):
+    """
+    Plan a turn and write its policy table to a binary file.
+    """
+    if num_dice > POLICY_MAX_DICE:
+        raise ValueError("policy files hold at most %d dice" % POLICY_MAX_DICE)
+    hands, holds, values = plan_turn(num_dice, num_die_sides, score_function, rolls)
+    with open(path, "wb") as policy_file:
+        policy_file.write(POLICY_HEADER.pack(POLICY_MAGIC, num_dice, num_die_sides, rolls))
+        for roll_holds in holds:
+            array("B", roll_holds).tofile(policy_file)
+        for roll_values in values:
+            roll_values = array("d", roll_values)
+            if sys.byteorder == "big":
+                roll_values.byteswap()
+            roll_values.tofile(policy_file)
+
+
+class PolicyTable:
+    """
+    Read-only policy table memory-mapped from a file written by
+    write_policy.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as policy_file:
+            self._map = mmap.mmap(policy_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._num_dice, self._num_die_sides, self._rolls = \
+            POLICY_HEADER.unpack_from(self._map, 0)
+        if magic != POLICY_MAGIC:
+            raise ValueError("not a Yahtzee policy file")
+        self._num_hands = hand_rank((self._num_die_sides,) * self._num_dice,
+                                    self._num_die_sides) + 1
+        self._values_offset = (POLICY_HEADER.size +
+                               (self._rolls - 1) * self._num_hands)
+
+    def close(self):
+        """
+        Release the memory map.
+        """
+        self._map.close()
+
+    def get_hold(self, hand, roll):
+        """
+        Return the dice to hold from hand after roll number roll
+        (1 to rolls - 1).
+        """
+        hand = tuple(sorted(hand))
+        offset = (POLICY_HEADER.size + (roll - 1) * self._num_hands +
+                  hand_rank(hand, self._num_die_sides))
+        return apply_mask(hand, struct.unpack_from("B", self._map, offset)[0])
+
+    def get_value(self, hand, roll):
+        """
+        Return the expected final score of hand after roll number
+        roll (1 to rolls) when playing the policy.
+        """
+        hand = tuple(sorted(hand))
+        offset = (self._values_offset +
+                  POLICY_VALUE.size * ((roll - 1) * self._num_hands +
+                                       hand_rank(hand, self._num_die_sides)))
+        return POLICY_VALUE.unpack_from(self._map, offset)[0]
+
+
 def run_example():
     """
     Compute the dice to hold and expected score for an example hand
@@ -128,11 +499,18 @@ def run_example():
     print "Best strategy for hand", hand, "is to hold", hold, "with expected score", hand_score
     
     
-run_example()
+# The CodeSkulptor modules are only imported here, so the planner and
+# PolicyTable above can be imported without them.
+
+if __name__ == "__main__":
+    # Used to increase the timeout, if necessary
+    import codeskulptor
+    codeskulptor.set_timeout(20)
 
+    run_example()
 
-import poc_holds_testsuite
-poc_holds_testsuite.run_suite(gen_all_holds)
+    import poc_holds_testsuite
+    poc_holds_testsuite.run_suite(gen_all_holds)
                                        
     
     
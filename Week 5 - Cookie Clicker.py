@@ -2,30 +2,263 @@
 Cookie Clicker Simulator
 """
 
-import simpleplot
 import math
-
-# Used to increase the timeout, if necessary
-import codeskulptor
-codeskulptor.set_timeout(20)
+import bisect
+import csv
+import heapq
+import pickle
+import struct
+import timeit
+from array import array
 
 import poc_clicker_provided as provided
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Constants
 SIM_TIME = 10000000000.0
 
+"""
+Columnar purchase history.
+
+Stores the history as parallel arrays of doubles for the time, cost
+and total cookies of each entry plus an array of item ids interned in
+a small name table, instead of a list of 4-tuples.  Strategies get a
+read-only view that indexes, iterates and compares like the list of
+tuples it replaces.
+"""
+
+# Binary history blocks, one per flush: a HISTORY_BLOCK header (first
+# item id defined, number of names, number of records), then each new
+# item name as a HISTORY_NAME length (-1 for None) and its bytes, then
+# the HISTORY_RECORD records: time, cost, total cookies, item id
+HISTORY_BLOCK = struct.Struct("<iii")
+HISTORY_NAME = struct.Struct("<i")
+HISTORY_RECORD = struct.Struct("<dddi")
+
+
+class ClickerHistory:
+    """
+    Purchase history of one game.
+
+    With stride > 1 only the first entry and every stride-th purchase
+    are kept.  With a sink file the history is written out every
+    flush_every entries (as CSV rows or binary blocks that
+    read_history decodes) and dropped from memory, so the view only
+    holds the entries written since the last flush.  The remaining
+    entries are flushed when the game ends in ClickerSimulation or
+    simulate_clicker; call flush() after stopping a game early or
+    appending entries by hand.
+    """
+
+    def __init__(self, stride=1, sink=None, binary=False, flush_every=4096):
+        self._times = array("d")
+        self._costs = array("d")
+        self._totals = array("d")
+        self._item_ids = array("i")
+        self._item_names = []
+        self._name_ids = {}
+        self._stride = stride
+        # Purchases recorded, kept or not, shared with the view
+        self._purchases = array("l", [0])
+        self._sink = sink
+        self._binary = binary
+        self._names_written = 0
+        self._flush_every = flush_every
+        self._view = ClickerHistoryView(self._times, self._costs, self._totals,
+                                        self._item_ids, self._item_names,
+                                        self._purchases)
+        if sink is not None and not binary:
+            csv.writer(sink).writerow(["time", "item", "cost", "total"])
+        self.append((0.0, None, 0.0, 0.0))
+
+    def append(self, entry):
+        """
+        Record a (time, item, cost of item, total cookies) entry.
+        """
+        time, item, cost, total = entry
+        if item is not None:
+            self._purchases[0] += 1
+            if self._purchases[0] % self._stride:
+                return
+        item_id = self._name_ids.get(item)
+        if item_id is None:
+            item_id = len(self._item_names)
+            self._name_ids[item] = item_id
+            self._item_names.append(item)
+        self._times.append(time)
+        self._costs.append(cost)
+        self._totals.append(total)
+        self._item_ids.append(item_id)
+        if self._sink is not None and len(self._times) >= self._flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the entries held in memory to the sink and drop them.
+        """
+        if self._sink is None:
+            return
+        if self._binary:
+            new_names = self._item_names[self._names_written:]
+            self._sink.write(HISTORY_BLOCK.pack(self._names_written, len(new_names),
+                                                len(self._times)))
+            for name in new_names:
+                if name is None:
+                    self._sink.write(HISTORY_NAME.pack(-1))
+                else:
+                    name = str(name)
+                    self._sink.write(HISTORY_NAME.pack(len(name)) + name)
+            self._names_written = len(self._item_names)
+            for index in range(len(self._times)):
+                self._sink.write(HISTORY_RECORD.pack(self._times[index], self._costs[index],
+                                                     self._totals[index], self._item_ids[index]))
+        else:
+            csv.writer(self._sink).writerows(self._view)
+        for column in (self._times, self._costs, self._totals, self._item_ids):
+            del column[:]
+
+    def set_sink(self, sink, binary=False):
+        """
+        Stream the history to a new sink, for example after resuming
+        from a checkpoint (sinks are not saved in checkpoints).
+        """
+        self._sink = sink
+        self._binary = binary
+        # A new file needs the whole name table again
+        self._names_written = 0
+
+    def __getstate__(self):
+        history = dict(self.__dict__)
+        history["_sink"] = None
+        return history
+
+    def get_purchases(self):
+        """
+        Return the number of purchases made, including any dropped
+        by downsampling or flushed to the sink.
+        """
+        return self._purchases[0]
+
+    def get_item_names(self):
+        """
+        Return the item names indexed by item id.
+        """
+        return list(self._item_names)
+
+    def get_columns(self):
+        """
+        Return the time, cost, total cookies and item id arrays.
+        """
+        return self._times, self._costs, self._totals, self._item_ids
+
+    def view(self):
+        """
+        Return a read-only view of the history.
+        """
+        return self._view
+
+
+class ClickerHistoryView:
+    """
+    Read-only sequence of (time, item, cost of item, total cookies)
+    tuples backed by a ClickerHistory.
+    """
+
+    def __init__(self, times, costs, totals, item_ids, item_names, purchases):
+        self._times = times
+        self._costs = costs
+        self._totals = totals
+        self._item_ids = item_ids
+        self._item_names = item_names
+        self._purchases = purchases
+
+    def get_purchases(self):
+        """
+        Return the number of purchases made, including any dropped
+        by downsampling or flushed to the sink.
+        """
+        return self._purchases[0]
+
+    def __len__(self):
+        return len(self._times)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[pos] for pos in range(*index.indices(len(self)))]
+        return (self._times[index], self._item_names[self._item_ids[index]],
+                self._costs[index], self._totals[index])
+
+    def __iter__(self):
+        for index in range(len(self._times)):
+            yield self[index]
+
+    def __eq__(self, other):
+        try:
+            if len(other) != len(self):
+                return False
+        except TypeError:
+            return False
+        for entry, other_entry in zip(self, other):
+            if entry != tuple(other_entry):
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self[:])
+
+
+def read_history(history_file):
+    """
+    Return the list of (time, item, cost of item, total cookies)
+    entries in a file written by a binary ClickerHistory sink.
+    """
+    def read(size):
+        """
+        Read exactly size bytes.
+        """
+        data = history_file.read(size)
+        if len(data) != size:
+            raise ValueError("truncated history file")
+        return data
+
+    item_names = []
+    history = []
+    header = history_file.read(HISTORY_BLOCK.size)
+    while header:
+        if len(header) != HISTORY_BLOCK.size:
+            raise ValueError("truncated history file")
+        first_id, num_names, num_records = HISTORY_BLOCK.unpack(header)
+        del item_names[first_id:]
+        for dummy_name in range(num_names):
+            length = HISTORY_NAME.unpack(read(HISTORY_NAME.size))[0]
+            item_names.append(None if length < 0 else read(length))
+        for dummy_record in range(num_records):
+            time, cost, total, item_id = HISTORY_RECORD.unpack(read(HISTORY_RECORD.size))
+            history.append((time, item_names[item_id], cost, total))
+        header = history_file.read(HISTORY_BLOCK.size)
+    return history
+
+
 class ClickerState:
     """
     Simple class to keep track of the game state.
     """
     
-    def __init__(self):
+    def __init__(self, history=None):
         self._current_time = 0.0
         self._item_bought = None
         self._item_cost = 0.0
         self._total_cookies = 0.0
-        self._lst_history = [(self._current_time, self._item_bought, 
-                              self._item_cost, self._total_cookies)]
+        if history is None:
+            history = ClickerHistory()
+        self._history = history
         
         self._current_cookies = 0.0
         self._current_cps = 1.0
@@ -64,6 +297,14 @@ class ClickerState:
         Should return a float
         """
         return self._current_time
+
+    def get_total_cookies(self):
+        """
+        Get the total number of cookies produced
+
+        Should return a float
+        """
+        return self._total_cookies
     
     def get_history(self):
         """
@@ -74,10 +315,20 @@ class ClickerState:
 
         For example: [(0.0, None, 0.0, 0.0)]
 
-        Should return a copy of any internal data structures,
-        so that they will not be modified outside of the class.
+        Returns a read-only view of the history rather than a
+        copy, so it is cheap to hand to a strategy on every call.
+        With a downsampled history the view only holds the kept
+        entries, and with a flushing sink only the entries since the
+        last flush.
+        """
+        return self._history.view()
+
+    def get_history_store(self):
+        """
+        Return the ClickerHistory behind get_history, for example to
+        attach a sink to it or flush it.
         """
-        return self._lst_history 
+        return self._history
 
     def time_until(self, cookies):
         """
@@ -112,6 +363,7 @@ class ClickerState:
         Buy an item and update state
 
         Should do nothing if you cannot afford the item
+        Returns whether the item was bought
         """
         cost_flt = float(cost)
         cps_flt = float(additional_cps)
@@ -121,9 +373,10 @@ class ClickerState:
             self._current_cookies -= cost_flt
             self._current_cps += cps_flt
             his_tuple = (self._current_time, item_name, cost_flt, self._total_cookies)
-            self._lst_history.append(his_tuple)
+            self._history.append(his_tuple)
+            return True
         else:
-            pass
+            return False
         
   
     def get_name(self):
@@ -135,33 +388,244 @@ class ClickerState:
         return self._item_bought
     
     
-def simulate_clicker(build_info, duration, strategy):
+"""
+Indexed build info.
+
+Wraps a build info and keeps its items sorted by (cost, order) and in
+a heap by best cps per cost, so the strategies can find the cheapest,
+the most expensive affordable and the best ratio item without
+scanning the whole catalog.  order is the item's position in
+build_items(), so ties go to the first item exactly as with
+costs.index(min(costs)).
+"""
+
+
+class IndexedBuildInfo:
+    """
+    Build info wrapper with cost and cps-per-cost indexes that are
+    updated when update_item raises a price.
+    """
+
+    def __init__(self, build_info):
+        self._build_info = build_info
+        self._items = build_info.build_items()
+        self._order = dict((item, order) for order, item in enumerate(self._items))
+        self._by_cost = sorted((build_info.get_cost(item), order, item)
+                               for order, item in enumerate(self._items))
+        self._by_ratio = []
+        for item in self._items:
+            self._push_ratio(item)
+
+    def _push_ratio(self, item):
+        """
+        Add the current ratio of an item to the heap.
+        """
+        cost = self._build_info.get_cost(item)
+        heapq.heappush(self._by_ratio, (-(self._build_info.get_cps(item) / cost),
+                                        self._order[item], cost, item))
+
+    def build_items(self):
+        """
+        Get a list of buildable items
+        """
+        return list(self._items)
+
+    def get_cost(self, item):
+        """
+        Get the current cost of an item
+        """
+        return self._build_info.get_cost(item)
+
+    def get_cps(self, item):
+        """
+        Get the current CPS of an item
+        """
+        return self._build_info.get_cps(item)
+
+    def update_item(self, item):
+        """
+        Update the cost of an item by the growth factor and move it
+        in the indexes.
+        """
+        entry = (self._build_info.get_cost(item), self._order[item], item)
+        del self._by_cost[bisect.bisect_left(self._by_cost, entry)]
+        self._build_info.update_item(item)
+        bisect.insort(self._by_cost, (self._build_info.get_cost(item),
+                                      self._order[item], item))
+        self._push_ratio(item)
+        if len(self._by_ratio) > 2 * len(self._items):
+            # Drop the stale entries left behind by old prices
+            self._by_ratio = []
+            for other in self._items:
+                self._push_ratio(other)
+
+    def clone(self):
+        """
+        Return a clone of this indexed build info
+        """
+        return IndexedBuildInfo(self._build_info.clone())
+
+    def cheapest_item(self):
+        """
+        Return the cheapest item.
+        """
+        return self._by_cost[0][2]
+
+    def most_expensive_affordable(self, budget):
+        """
+        Return the most expensive item costing at most budget, or
+        None if there is no such item.
+        """
+        index = bisect.bisect_right(self._by_cost, (budget, len(self._items)))
+        if index == 0:
+            return None
+        cost = self._by_cost[index - 1][0]
+        return self._by_cost[bisect.bisect_left(self._by_cost, (cost,))][2]
+
+    def best_ratio_item(self):
+        """
+        Return the item with the highest cps per cost.
+        """
+        while self._by_ratio[0][2] != self._build_info.get_cost(self._by_ratio[0][3]):
+            heapq.heappop(self._by_ratio)
+        return self._by_ratio[0][3]
+
+
+"""
+Streaming simulation.
+
+ClickerSimulation runs the simulate_clicker loop one purchase at a
+time as an iterator, so a long run can be watched, stopped early or
+checkpointed to a file and resumed later.  Strategies and history
+sinks are not saved in checkpoints; pass them again to
+resume_simulation.
+"""
+
+
+class ClickerSimulation:
+    """
+    Iterator over the purchases of one Cookie Clicker game.  Each
+    step returns the (time, item, cost of item, total cookies)
+    entry of the next purchase.
+    """
+
+    def __init__(self, build_info, duration, strategy, history=None):
+        build_clone = build_info.clone()
+        if not isinstance(build_clone, IndexedBuildInfo):
+            build_clone = IndexedBuildInfo(build_clone)
+        self._build_clone = build_clone
+        self._state = ClickerState(history)
+        self._duration = duration
+        self._strategy = strategy
+        self._time_left = 0.0
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """
+        Run the game until the next purchase and return its history
+        entry.  Raises StopIteration once the game is over.
+        """
+        state = self._state
+        build_clone = self._build_clone
+        strategy = self._strategy
+        while not self._finished:
+            if state.get_time() > self._duration:
+                self._finish()
+                break
+            time = self._duration - state.get_time()
+            self._time_left = time
+            item_name = strategy(state.get_cookies(), state.get_cps(), state.get_history(), time, build_clone)
+            if item_name == None:
+                self._finish()
+                break
+            if state.time_until(build_clone.get_cost(item_name)) > time:
+                self._finish()
+                break
+            item_name = strategy(state.get_cookies(), state.get_cps(), state.get_history(), time, build_clone)
+            state.wait(state.time_until(build_clone.get_cost(item_name)))
+            cost = build_clone.get_cost(item_name)
+            bought = state.buy_item(item_name, cost, build_clone.get_cps(item_name))
+            build_clone.update_item(item_name)
+            if bought:
+                return (state.get_time(), item_name, float(cost), state.get_total_cookies())
+        raise StopIteration
+
+    __next__ = next
+
+    def _finish(self):
+        """
+        Wait out the time left after the last purchase and write the
+        rest of the history to its sink.
+        """
+        self._state.wait(self._time_left)
+        self._state.get_history_store().flush()
+        self._finished = True
+
+    def is_finished(self):
+        """
+        Return whether the game is over.
+        """
+        return self._finished
+
+    def get_state(self):
+        """
+        Return the ClickerState of the game so far.
+        """
+        return self._state
+
+    def run(self):
+        """
+        Play the rest of the game and return the final ClickerState.
+        """
+        for dummy_entry in self:
+            pass
+        return self._state
+
+    def set_strategy(self, strategy):
+        """
+        Set the strategy used for the rest of the game.
+        """
+        self._strategy = strategy
+
+    def save(self, path):
+        """
+        Write a checkpoint of the game to a file.
+        """
+        with open(path, "wb") as checkpoint_file:
+            pickle.dump(self, checkpoint_file, 2)
+
+    def __getstate__(self):
+        checkpoint = dict(self.__dict__)
+        checkpoint["_strategy"] = None
+        return checkpoint
+
+
+def resume_simulation(path, strategy, sink=None, binary=False):
+    """
+    Load a checkpoint written by ClickerSimulation.save and return a
+    simulation that continues it with the given strategy, streaming
+    its history to sink if one is given (see ClickerHistory).
+    """
+    with open(path, "rb") as checkpoint_file:
+        simulation = pickle.load(checkpoint_file)
+    simulation.set_strategy(strategy)
+    if sink is not None:
+        simulation.get_state().get_history_store().set_sink(sink, binary)
+    return simulation
+
+
+def simulate_clicker(build_info, duration, strategy, history=None):
     """
     Function to run a Cookie Clicker game for the given
     duration with the given strategy.  Returns a ClickerState
     object corresponding to the final state of the game.
+    history can be a ClickerHistory to downsample or stream
+    the purchase history.
     """
-    
-    build_clone = build_info.clone()
-    new_state = ClickerState()
-
-    while new_state.get_time() <= duration:
-        time = duration - new_state.get_time()
-        item_name = new_state.get_name()
-        item_name = strategy(new_state.get_cookies(), new_state.get_cps(), new_state.get_history(), time, build_clone)
-        if item_name == None:
-            break
-        if new_state.time_until(build_clone.get_cost(item_name)) > time:
-            break 
-        else:
-            item_name = strategy(new_state.get_cookies(), new_state.get_cps(),new_state.get_history(),  time, build_clone)
-            new_state.wait(new_state.time_until(build_clone.get_cost(item_name)))
-            new_state.buy_item(item_name, build_clone.get_cost(item_name), build_clone.get_cps(item_name))
-            build_clone.update_item(item_name)
-    
-    new_state.wait(time)
- 
-    return new_state
+    return ClickerSimulation(build_info, duration, strategy, history).run()
 
 
 def strategy_cursor_broken(cookies, cps, history, time_left, build_info):
@@ -200,6 +664,12 @@ def strategy_cheap(cookies, cps, history, time_left, build_info):
     #    return None
     
     
+    if hasattr(build_info, "cheapest_item"):
+        cheap_item = build_info.cheapest_item()
+        if (cookies + cps * time_left) < build_info.get_cost(cheap_item):
+            return None
+        return cheap_item
+
     cheapest = build_info.build_items()
     costs = map(build_info.get_cost, cheapest)
     index = costs.index(min(costs))
@@ -214,6 +684,9 @@ def strategy_expensive(cookies, cps, history, time_left, build_info):
     """
     Always buy the most expensive item you can afford in the time left.
     """
+    if hasattr(build_info, "most_expensive_affordable"):
+        return build_info.most_expensive_affordable(cookies + cps * time_left)
+
     expensive = build_info.build_items()
     costs = map(build_info.get_cost, expensive)
     
@@ -237,7 +710,8 @@ def strategy_best(cookies, cps, history, time_left, build_info):
     """
     The best strategy that you are able to implement.
     """
-
+    if hasattr(build_info, "best_ratio_item"):
+        return build_info.best_ratio_item()
 
     best = build_info.build_items()
     costs = map(build_info.get_cost, best)
@@ -249,8 +723,487 @@ def strategy_best(cookies, cps, history, time_left, build_info):
     best_idx = best_list.index(max(best_list))
     best_item = best[best_idx] 
     return best_item
-    
-        
+
+
+"""
+Batched NumPy simulator.
+
+Runs many games at once, one row per game, holding cookies, cps,
+time and total cookies as arrays and item costs and cps as
+(games, items) arrays.  Each row lists the items in the order of
+that game's cloned build info, so ties break as they would in
+simulate_clicker.  Every pass of the loop advances all the games
+that are still buying to their next purchase with the same
+time_until ceiling and the same float operations as
+simulate_clicker, so each row ends in exactly the state
+simulate_clicker would reach for that game.  Catalogs with fewer
+items are padded with items that cost inf and give no cps, which no
+strategy can pick.
+"""
+
+
+def batch_strategy_cursor_broken(cookies, cps, time_left, costs, item_cps, names):
+    """
+    Batch version of strategy_cursor_broken.
+
+    Batch strategies get one entry per game in cookies, cps and
+    time_left, one row per game in costs and item_cps, and the item
+    names of each row in names.  They return the column of the item
+    to buy for each game, or -1 for None.
+    """
+    return np.array([game_names.index("Cursor") for game_names in names])
+
+def batch_strategy_none(cookies, cps, time_left, costs, item_cps, names):
+    """
+    Batch version of strategy_none.
+    """
+    return np.repeat(-1, len(cookies))
+
+def batch_strategy_cheap(cookies, cps, time_left, costs, item_cps, names):
+    """
+    Batch version of strategy_cheap.
+    """
+    choice = costs.argmin(axis=1)
+    cheapest = costs[np.arange(len(choice)), choice]
+    return np.where(cookies + cps * time_left < cheapest, -1, choice)
+
+def batch_strategy_expensive(cookies, cps, time_left, costs, item_cps, names):
+    """
+    Batch version of strategy_expensive.
+    """
+    budget = (cookies + cps * time_left)[:, np.newaxis]
+    affordable = np.where(costs <= budget, costs, -np.inf)
+    choice = affordable.argmax(axis=1)
+    return np.where(np.isneginf(affordable.max(axis=1)), -1, choice)
+
+def batch_strategy_best(cookies, cps, time_left, costs, item_cps, names):
+    """
+    Batch version of strategy_best.
+    """
+    return (item_cps / costs).argmax(axis=1)
+
+# Strategies simulate_clicker_batch can evaluate for all games at once
+BATCH_STRATEGIES = {strategy_cursor_broken: batch_strategy_cursor_broken,
+                    strategy_none: batch_strategy_none,
+                    strategy_cheap: batch_strategy_cheap,
+                    strategy_expensive: batch_strategy_expensive,
+                    strategy_best: batch_strategy_best}
+
+
+class BatchBuildView:
+    """
+    Read-only build info for one game of a batch, so ordinary
+    strategy functions can run against the batch arrays.
+    """
+
+    def __init__(self, names, costs, item_cps, game):
+        self._names = names
+        self._columns = dict((name, column) for column, name in enumerate(names))
+        self._costs = costs
+        self._item_cps = item_cps
+        self._game = game
+
+    def build_items(self):
+        """
+        Get a list of buildable items
+        """
+        return list(self._names)
+
+    def get_cost(self, item):
+        """
+        Get the current cost of an item
+        """
+        return float(self._costs[self._game, self._columns[item]])
+
+    def get_cps(self, item):
+        """
+        Get the current CPS of an item
+        """
+        return float(self._item_cps[self._game, self._columns[item]])
+
+    def get_column(self, item):
+        """
+        Get the column of an item in the batch arrays
+        """
+        return self._columns[item]
+
+
+class BatchClickerState:
+    """
+    Final states of a batch of games, one array entry per game.
+    """
+
+    def __init__(self, num_games, keep_history):
+        self._current_time = np.zeros(num_games)
+        self._current_cookies = np.zeros(num_games)
+        self._current_cps = np.ones(num_games)
+        self._total_cookies = np.zeros(num_games)
+        self._histories = None
+        if keep_history:
+            self._histories = [[(0.0, None, 0.0, 0.0)] for dummy_game in range(num_games)]
+
+    def get_num_games(self):
+        """
+        Get the number of games in the batch.
+        """
+        return len(self._current_time)
+
+    def get_cookies(self):
+        """
+        Return the array of current cookies.
+        """
+        return self._current_cookies
+
+    def get_cps(self):
+        """
+        Return the array of current CPS.
+        """
+        return self._current_cps
+
+    def get_time(self):
+        """
+        Return the array of current times.
+        """
+        return self._current_time
+
+    def get_total_cookies(self):
+        """
+        Return the array of total cookies.
+        """
+        return self._total_cookies
+
+    def get_history(self, game):
+        """
+        Return the history list of one game, in the same form as
+        ClickerState.get_history, or None if histories were not kept.
+        """
+        if self._histories is None:
+            return None
+        return self._histories[game]
+
+    def time_until(self, games, cookies):
+        """
+        Return the times until the given games have the given numbers
+        of cookies, rounded up like ClickerState.time_until.
+        """
+        current = self._current_cookies[games]
+        return np.where(current < cookies,
+                        np.ceil((cookies - current) / self._current_cps[games]),
+                        0.0)
+
+    def wait(self, games, time):
+        """
+        Wait for the given amounts of time in the given games.
+        """
+        waiting = time > 0
+        games = games[waiting]
+        time = time[waiting]
+        earned = time * self._current_cps[games]
+        self._current_time[games] += time
+        self._current_cookies[games] += earned
+        self._total_cookies[games] += earned
+
+    def buy_items(self, games, names, choice, cost, additional_cps):
+        """
+        Buy one item in each of the given games that can afford it.
+        """
+        affordable = self._current_cookies[games] >= cost
+        games = games[affordable]
+        self._current_cookies[games] -= cost[affordable]
+        self._current_cps[games] += additional_cps[affordable]
+        if self._histories is not None:
+            for game, column, item_cost in zip(games, choice[affordable],
+                                               cost[affordable]):
+                self._histories[game].append((float(self._current_time[game]),
+                                              names[game][column], float(item_cost),
+                                              float(self._total_cookies[game])))
+
+
+# Price updates per item checked when probing a build info's growth
+GROWTH_PROBE_STEPS = 3
+
+
+def get_growth_factor(build_info, growth_factor=None):
+    """
+    Return the factor update_item multiplies prices by, found by
+    updating every item of a scratch clone a few times.  If
+    growth_factor is given it is checked instead.  Raises ValueError
+    if no single factor reproduces every new price exactly.
+    """
+    probe = build_info.clone()
+    prices = []
+    for item in probe.build_items():
+        item_prices = [float(probe.get_cost(item))]
+        for dummy_step in range(GROWTH_PROBE_STEPS):
+            probe.update_item(item)
+            item_prices.append(float(probe.get_cost(item)))
+        prices.append(item_prices)
+
+    if growth_factor is not None:
+        candidates = [growth_factor]
+    else:
+        guess = 1.0
+        for item_prices in prices:
+            if item_prices[0] != 0:
+                guess = item_prices[1] / item_prices[0]
+                break
+        # The quotient can be one ulp away from the factor itself
+        candidates = [guess, np.nextafter(guess, 0.0), np.nextafter(guess, np.inf)]
+    for factor in candidates:
+        if all(item_prices[step] * factor == item_prices[step + 1]
+               for item_prices in prices for step in range(GROWTH_PROBE_STEPS)):
+            return float(factor)
+    raise ValueError("build info prices do not grow by the factor %r" % (candidates[0],))
+
+
+def simulate_clicker_batch(build_infos, duration, strategy,
+                           growth_factors=None, keep_history=False):
+    """
+    Run one Cookie Clicker game per build info in build_infos for
+    the given duration with the given strategy.  growth_factors is
+    the price growth of each build info (one value for all of them,
+    or one per game); by default it is read from each build info
+    with get_growth_factor, and given values are checked the same
+    way.  Returns a BatchClickerState, with histories if
+    keep_history is set or the strategy needs them.
+
+    Strategies in BATCH_STRATEGIES are evaluated with array
+    operations; any other strategy is called once per game with a
+    BatchBuildView, exactly as simulate_clicker would call it.
+    Requires numpy.
+    """
+    if np is None:
+        raise ImportError("simulate_clicker_batch requires numpy")
+    num_games = len(build_infos)
+    build_clones = [info.clone() for info in build_infos]
+    names = [build_clone.build_items() for build_clone in build_clones]
+    num_items = max(len(game_names) for game_names in names)
+    costs = np.empty((num_games, num_items))
+    costs[:] = float("inf")
+    item_cps = np.zeros((num_games, num_items))
+    for game, build_clone in enumerate(build_clones):
+        costs[game, :len(names[game])] = map(build_clone.get_cost, names[game])
+        item_cps[game, :len(names[game])] = map(build_clone.get_cps, names[game])
+
+    if growth_factors is None or not hasattr(growth_factors, "__len__"):
+        growth_factors = [growth_factors] * num_games
+    growth = np.array([get_growth_factor(build_clone, factor)
+                       for build_clone, factor in zip(build_clones, growth_factors)])
+
+    batch_strategy = BATCH_STRATEGIES.get(strategy)
+    state = BatchClickerState(num_games, keep_history or batch_strategy is None)
+    views = [BatchBuildView(names[game], costs, item_cps, game)
+             for game in range(num_games)]
+
+    def choose(games):
+        """
+        Ask the strategy for the next item of each game.
+        """
+        if batch_strategy is not None:
+            return batch_strategy(state.get_cookies()[games], state.get_cps()[games],
+                                  time_left[games], costs[games], item_cps[games],
+                                  [names[game] for game in games])
+        choice = np.empty(len(games), dtype=int)
+        for index, game in enumerate(games):
+            item_name = strategy(float(state.get_cookies()[game]),
+                                 float(state.get_cps()[game]),
+                                 state.get_history(game),
+                                 float(time_left[game]), views[game])
+            choice[index] = -1 if item_name is None else views[game].get_column(item_name)
+        return choice
+
+    time_left = np.zeros(num_games)
+    games = np.arange(num_games)
+    while len(games):
+        time_left[games] = duration - state.get_time()[games]
+        choice = choose(games)
+        cost = costs[games, choice]
+        buying = (choice >= 0) & ~(state.time_until(games, cost) > time_left[games])
+        games = games[buying]
+        if batch_strategy is None:
+            # simulate_clicker asks the strategy a second time
+            choice = choose(games)
+            buying = choice >= 0
+            games = games[buying]
+        choice = choice[buying]
+        cost = costs[games, choice]
+        state.wait(games, state.time_until(games, cost))
+        state.buy_items(games, names, choice, cost, item_cps[games, choice])
+        costs[games, choice] *= growth[games]
+
+    state.wait(np.arange(num_games), time_left)
+    return state
+
+
+"""
+Purchase planner.
+
+plan_purchases searches purchase orders depth first, simulating each
+one with the same time_until ceiling and float operations as
+simulate_clicker.  A branch is cut when an upper bound on the total
+cookies it can still reach is no better than the best plan found.
+The bound relaxes the game so cookies turn into cps continuously at
+the best cps per cost r available now; prices only grow, so
+cps + r * cookies can at most grow like e^(r * t), which gives
+
+    total + (cps + r * cookies) * (e^(r * time_left) - 1) / r
+
+States with the same items owned are compared too: one that is no
+later with at least as many cookies and as much cps can always copy
+the other's purchases, so the other is dropped.  Items that pay for
+themselves soonest are tried first, so good plans are found early and
+a search cut short by its time budget still returns a useful plan.
+"""
+
+# Slack on the upper bound so float rounding never cuts the best plan
+PLAN_BOUND_SLACK = 1.000000001
+
+# Number of search states between checks of the time budget
+PLAN_CHECK_INTERVAL = 1024
+
+
+def plan_purchases(build_info, duration, time_budget=None):
+    """
+    Find the purchase order that ends a game of the given duration
+    with the most total cookies.  Returns (plan, total cookies,
+    optimal), where plan is a list of item names and optimal is
+    False if time_budget seconds ran out before the search finished,
+    in which case the plan is the best found so far.
+
+    The bound is only finite while r * time_left stays below 700;
+    beyond that (for example at SIM_TIME, or after a few thousand
+    seconds with cheap high-cps items) only the dominance check cuts
+    the search, which then will not finish in practice.  Give long
+    games a time_budget and expect optimal to be False.
+    """
+    build_clone = build_info.clone()
+    items = build_clone.build_items()
+    item_cps = map(build_clone.get_cps, items)
+    costs = [[build_clone.get_cost(item)] for item in items]
+    by_index = range(len(items))
+
+    def get_cost(index, count):
+        """
+        Return the cost of an item after it has been bought count
+        times.
+        """
+        item_costs = costs[index]
+        while len(item_costs) <= count:
+            build_clone.update_item(items[index])
+            item_costs.append(build_clone.get_cost(items[index]))
+        return item_costs[count]
+
+    frontiers = {}
+
+    def is_dominated(counts, now, cookies, cps):
+        """
+        Return whether a state with the same items owned is at least
+        as far along, and otherwise record this state.
+        """
+        frontier = frontiers.setdefault(counts, [])
+        for other_now, other_cookies, other_cps in frontier:
+            if other_now <= now and other_cookies >= cookies and other_cps >= cps:
+                return True
+        frontier[:] = [other for other in frontier
+                       if not (now <= other[0] and cookies >= other[1] and cps >= other[2])]
+        frontier.append((now, cookies, cps))
+        return False
+
+    if time_budget is not None:
+        deadline = timeit.default_timer() + time_budget
+    best_total = None
+    best_path = None
+    optimal = True
+    searched = 0
+    stack = [(0.0, 0.0, 1.0, 0.0, (0,) * len(items), None)]
+    while stack:
+        searched += 1
+        if (time_budget is not None and searched % PLAN_CHECK_INTERVAL == 0
+                and timeit.default_timer() > deadline):
+            optimal = False
+            break
+        now, cookies, cps, total, counts, path = stack.pop()
+        time_left = duration - now
+
+        # Value of stopping here and waiting out the game
+        final_total = total
+        if time_left > 0:
+            final_total += time_left * cps
+        if best_total is None or final_total > best_total:
+            best_total = final_total
+            best_path = path
+
+        best_ratio = max(item_cps[index] / get_cost(index, counts[index])
+                         for index in by_index)
+        if best_ratio * time_left > 700.0:
+            bound = float("inf")
+        elif best_ratio > 0 and time_left > 0:
+            bound = total + ((cps + best_ratio * cookies) *
+                             math.expm1(best_ratio * time_left) / best_ratio)
+        else:
+            bound = final_total
+        if bound * PLAN_BOUND_SLACK <= best_total:
+            continue
+
+        children = []
+        for index in by_index:
+            if item_cps[index] <= 0:
+                # Buying it only spends cookies, so it never helps
+                continue
+            cost = get_cost(index, counts[index])
+            wait_time = 0.0
+            if cookies < cost:
+                wait_time = float(math.ceil((cost - cookies) / cps))
+            if wait_time > time_left:
+                continue
+            child_now, child_cookies, child_total = now, cookies, total
+            if wait_time > 0:
+                child_now += wait_time
+                child_cookies += wait_time * cps
+                child_total += wait_time * cps
+            if child_cookies < float(cost):
+                continue
+            child_cookies -= float(cost)
+            child_cps = cps + float(item_cps[index])
+            child_counts = counts[:index] + (counts[index] + 1,) + counts[index + 1:]
+            if is_dominated(child_counts, child_now, child_cookies, child_cps):
+                continue
+            # Explore first the items that pay for themselves soonest
+            payback = child_now + cost / item_cps[index]
+            children.append((payback, index, (child_now, child_cookies, child_cps,
+                                              child_total, child_counts, (index, path))))
+        children.sort(reverse=True)
+        stack.extend(child for dummy_payback, dummy_index, child in children)
+
+    plan = []
+    while best_path is not None:
+        index, best_path = best_path
+        plan.append(items[index])
+    plan.reverse()
+    return plan, best_total, optimal
+
+
+def make_plan_strategy(plan):
+    """
+    Return a strategy that buys the items of plan in order, picking
+    the next one by the number of purchases so far.  That count comes
+    from the history view, so it stays right when the history is
+    downsampled or flushed; plain history lists are counted by length.
+    """
+    def strategy_plan(cookies, cps, history, time_left, build_info):
+        """
+        Buy the next item of the plan, or None once it is done.
+        """
+        if hasattr(history, "get_purchases"):
+            purchases = history.get_purchases()
+        else:
+            purchases = len(history) - 1
+        if purchases < len(plan):
+            return plan[purchases]
+        return None
+    return strategy_plan
+
+
 def run_strategy(strategy_name, time, strategy):
     """
     Run a simulation for the given time with one strategy.
@@ -260,6 +1213,7 @@ def run_strategy(strategy_name, time, strategy):
 
     # Plot total cookies over time
 
+    #import simpleplot
     #history = state.get_history()
     #history = [(item[0], item[3]) for item in history]
     #simpleplot.plot_lines(strategy_name, 1000, 400, 'Time', 'Total Cookies', [history], True)
@@ -274,7 +1228,16 @@ def run():
     run_strategy("Cheap", SIM_TIME, strategy_cheap)
     run_strategy("Expensive", SIM_TIME, strategy_expensive)
     run_strategy("Best", SIM_TIME, strategy_best)
-    
-run()
+
+
+# The CodeSkulptor modules are only imported here, so the simulators
+# above can be imported (and checkpoints unpickled) without them.
+
+if __name__ == "__main__":
+    # Used to increase the timeout, if necessary
+    import codeskulptor
+    codeskulptor.set_timeout(20)
+
+    run()
     
 